@@ -18,7 +18,8 @@ class App:
     def invoke(self, update_date: datetime):
         current_user_info = self._vrc.get_current_user()
         friends_in_vrc = self._vrc.get_friends(current_user_info, update_date)
-        friends_in_dyn = self._dyn.get_friends()
+        # 差分の反映で同じパーティションへ書込むため、先に全件を取得
+        friends_in_dyn = list(self._dyn.get_friends())
 
         for item in extract_change_friends(friends_in_dyn, friends_in_vrc, update_date):
             self._dyn.put_friend(item)
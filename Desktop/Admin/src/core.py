@@ -30,6 +30,11 @@ class AccountManager:
         dynamo = dynamodb.Service(account, app_table, app_table, sess, logger)
         dynamo.disconnect_app("notion")
 
+    def set_activity_shards(self, account: str, app_table: str, shard_count: int):
+        sess = boto3.Session()
+        dynamo = dynamodb.Service(account, app_table, app_table, sess, logger)
+        dynamo.set_activity_shards(shard_count)
+
 
 class FriendManager:
     def export_csv(self, account: str, app_table: str, path: str):
@@ -61,7 +66,7 @@ class FriendManager:
     def clear_all(self, account: str, app_table: str):
         sess = boto3.Session()
         dynamo = dynamodb.Service(account, app_table, app_table, sess, logger)
-        friends = dynamo.get_friends()
+        friends = list(dynamo.get_friends())
 
         for item in friends:
             dynamo.put_friend(entity.OperationInfo(entity.ActionType.REMOVE, None, item))
@@ -46,4 +46,4 @@ class TestFriendManager:
         assert import_txt == export_txt
 
         target.clear_all(ACCOUNT_ID, APP_GET_TABLE_NAME)
-        assert len(dyn.get_friends()) == 0
+        assert len(list(dyn.get_friends())) == 0
@@ -1,20 +1,44 @@
 import boto3
+import collections
+import contextlib
+import cProfile
+import ctypes
+import ctypes.util
 import dataclasses
 import datetime
+import functools
+import gzip
+import hashlib
 import json
 import logging
+import mmap
+import multiprocessing
+import os
+import pickle
+import pstats
+import random
 import re
+import select
+import sqlite3
+import struct
 import sys
+import tempfile
+import threading
 import time
 import traceback
 from argparse import ArgumentParser
+from botocore.exceptions import ClientError, ParamValidationError
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from configparser import ConfigParser
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from typing import Iterable, Tuple
 from common import dynamodb, entity, sqs
 
-import schedule
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 log_dir = Path(__file__) / "../../log"
 log_dir = log_dir.resolve()
@@ -24,30 +48,140 @@ log_level = logging.INFO
 
 logger = logging.getLogger(__name__)
 logger.setLevel(log_level)
-log_hand = RotatingFileHandler(log_file, maxBytes=5242880, backupCount=3, encoding="utf-8")
-log_hand.setLevel(log_level)
-log_form = logging.Formatter(
-    "%(asctime)s %(levelname)s - %(filename)s.%(name)s.%(funcName)s - %(message)s", "%Y-%m-%dT%H:%M:%S")
-log_hand.setFormatter(log_form)
-logger.addHandler(log_hand)
+# ログファイルは呼び出し元のプロセスのみで開く (プロセスプールのワーカは init_worker で呼び出し元へ送る)
+if multiprocessing.parent_process() is None:
+    log_hand = RotatingFileHandler(log_file, maxBytes=5242880, backupCount=3, encoding="utf-8")
+    log_hand.setLevel(log_level)
+    log_form = logging.Formatter(
+        "%(asctime)s %(levelname)s - %(filename)s.%(name)s.%(funcName)s - %(message)s", "%Y-%m-%dT%H:%M:%S")
+    log_hand.setFormatter(log_form)
+    logger.addHandler(log_hand)
+
+
+LOG_FILE_PATTERNS = ["output_log_*.txt", "output_log_*.txt.gz", "output_log_*.txt.zst"]
+
+
+class StageStats:
+    # 処理段階毎の件数・バイト数・所要時間を集計
+    # (百分位数を求めるため、段階毎に所要時間の標本を一定数まで無作為に保持)
+    # (レコード毎に計測すると負荷が大きい段階は、チャンク単位の合計を1回として計上し、1件あたりの平均も出力)
+    SAMPLE_LEN = 10_000
+    PERCENTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._stages: dict[str, dict] = dict()
+
+    def add(self, name: str, elapsed_sec: float, count: int = 1, size: int = 0, unit: str = "call") -> None:
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = {"unit": unit, "count": 0, "bytes": 0, "total_sec": 0.0, "calls": 0, "samples": list()}
+            stage["count"] += count
+            stage["bytes"] += size
+            stage["total_sec"] += elapsed_sec
+            stage["calls"] += 1
+            samples = stage["samples"]
+            if len(samples) < self.SAMPLE_LEN:
+                samples.append(elapsed_sec)
+            else:
+                i = self._random.randrange(stage["calls"])
+                if i < self.SAMPLE_LEN:
+                    samples[i] = elapsed_sec
+
+    @contextlib.contextmanager
+    def measure(self, name: str, count: int = 1, size: int = 0):
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - time_start, count, size)
+
+    def pop(self) -> dict[str, dict]:
+        # 集計結果を取り出して初期化 (プロセスプールから集計結果を返す場合に使用)
+        with self._lock:
+            value = self._stages
+            self._stages = dict()
+        return value
+
+    def merge(self, value: dict[str, dict]) -> None:
+        with self._lock:
+            for name, other in value.items():
+                stage = self._stages.setdefault(name, {"unit": other["unit"], "count": 0, "bytes": 0, "total_sec": 0.0, "calls": 0, "samples": list()})
+                for key in ("count", "bytes", "total_sec", "calls"):
+                    stage[key] += other[key]
+                stage["samples"] = (stage["samples"] + other["samples"])[:self.SAMPLE_LEN]
+
+    def to_dict(self) -> dict[str, dict]:
+        value = dict()
+        with self._lock:
+            for name, stage in self._stages.items():
+                samples = sorted(stage["samples"])
+                value[name] = {
+                    "unit": stage["unit"],
+                    "count": stage["count"],
+                    "bytes": stage["bytes"],
+                    "calls": stage["calls"],
+                    "total_sec": stage["total_sec"],
+                    **{f"p{int(q * 100)}_ms": samples[int(q * (len(samples) - 1))] * 1000 for q in self.PERCENTILES if len(samples) > 0},
+                    "max_ms": samples[-1] * 1000 if len(samples) > 0 else None,
+                    "avg_per_item_us": stage["total_sec"] / stage["count"] * 1_000_000 if stage["count"] > 0 else None
+                }
+        return value
+
+    def log(self) -> None:
+        for name, stage in self.to_dict().items():
+            percentiles = ", ".join(f"{key[:-3]} {val:.3f} ms" for key, val in stage.items() if key.endswith("_ms") and val is not None)
+            calls = f"{stage['calls']} 回" if stage["unit"] == "call" else f"{stage['unit']} 単位の合計を {stage['calls']} 回"
+            per_item = f", 1件平均 {stage['avg_per_item_us']:.2f} us" if stage["avg_per_item_us"] is not None else ""
+            logger.info(
+                f"処理段階 {name}: {stage['count']} 件, {stage['bytes'] / 1_048_576:.1f} MB, "
+                f"合計 {stage['total_sec']:.3f} s ({calls}, {percentiles}{per_item})")
+
+    def dump(self, stats_path: Path) -> None:
+        stats_path.parent.mkdir(parents=True, exist_ok=True)
+        value = {"date": datetime.datetime.now().isoformat(timespec="seconds"), "stages": self.to_dict()}
+        stats_path.write_text(json.dumps(value, ensure_ascii=False, indent=2), encoding="utf8")
+
+
+stats = StageStats()
 
 
 class VRChatResource:
-    def __init__(self, log_dir: Path):
+    def __init__(self, log_dir: Path, parse_workers: int = 1, index_dir: Path = None):
         self._log_dir = log_dir
+        self._parse_workers = parse_workers if parse_workers > 0 else os.cpu_count()
+        self._index_dir = index_dir
 
     def read_log(self, target_user: str, configs: dict[str, entity.LogParserStatus]) -> Iterable[entity.LogEvent]:
         # 読込み対象を決定
+        time_start = time.perf_counter()
         dir = self._log_dir
         items = [(dir / file, conf) for file, conf in configs.items()]
         items = [(path, path.stat(), conf) for path, conf in items]
         items.sort(key=lambda val: val[1].st_size)
+        stats.add("read_log.stat", time.perf_counter() - time_start, len(items), sum(stat.st_size for _, stat, _ in items))
         count = len(items)
         items = [(path, conf, i != count - 1) for i, (path, stat, conf) in enumerate(items)]
 
-        # ログリーダーを作成 (最新ログは最後の行まで読まない)
+        # ログリーダーを作成 (最新ログは最後の行まで読まない。圧縮済みのログは書込み中ではないため最後まで読む)
         logger.info(f"ログファイルを検知 (Files Count: {count}).")
-        readers = [VRChatLogReader(path, last, target_user, conf) for path, conf, last in items]
+        readers = [
+            VRChatLogReader(path, last or is_archive(path), target_user, conf, index=self.get_index(path))
+            for path, conf, last in items
+        ]
+        if self._parse_workers > 1 and count > 1:
+            yield from self._read_log_parallel(readers)
+        else:
+            yield from self._read_log_sequential(readers)
+
+    def get_index(self, logfile_path: Path):
+        if self._index_dir is None:
+            return None
+        return ParserStateIndex(self._index_dir / f"{logfile_path.name}.index")
+
+    def _read_log_sequential(self, readers: list) -> Iterable[entity.LogEvent]:
         # ログを古い方から順次読み込み
         for log in readers:
             try:
@@ -62,46 +196,218 @@ class VRChatResource:
                 logger.error(msg)
                 raise
 
+    def _read_log_parallel(self, readers: list) -> Iterable[entity.LogEvent]:
+        # 各ログをプロセスプールで並列に解析し、古い方から順に出力
+        # (ステータスはファイル単位で独立しているため、ファイルの出力を終えた時点で更新する)
+        # (解析結果を保持するメモリを抑えるため、未取得の解析はワーカ数程度までとし、取り出す毎に次を投入)
+        logger.info(f"ログを並列に解析 (Workers: {self._parse_workers}).")
+        log_queue = multiprocessing.Queue()
+        log_listener = QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+        log_listener.start()
+        executor = ProcessPoolExecutor(max_workers=self._parse_workers, initializer=init_worker, initargs=(log_queue,))
+        try:
+            pending = iter(readers)
+            futures = collections.deque()
+            def submit_next():
+                log = next(pending, None)
+                if log is not None:
+                    futures.append((log, executor.submit(
+                        read_logfile, log._logfile_path, log._is_read_lastlog, log._target_user, log._status, log._index)))
+            for _ in range(self._parse_workers):
+                submit_next()
+            while futures:
+                log, future = futures.popleft()
+                submit_next()
+                try:
+                    log_items, status, log_stats = future.result()
+                    stats.merge(log_stats)
+                except FileNotFoundError as ex:
+                    # 処理中にファイルが消去された場合は読み込みをスキップ
+                    msg = f"ログ (\"{log._logfile_path}\") の解析がスキップされました. ファイルが見つかりません.\n{get_stacktrace()}\n"
+                    logger.warning(msg)
+                    continue
+                except Exception as ex:
+                    msg = f"ログ (\"{log._logfile_path}\") の解析が中断されました. 予期しない例外がスローされています.\n{get_stacktrace()}\n"
+                    logger.error(msg)
+                    raise
+
+                yield from log_items
+                log._status.update(status)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            log_listener.stop()
+            log_queue.close()
+
+
+class VRChatLogSegmenter:
+    REGEX_LOG_HEADER = re.compile(
+        rb"^\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}[^-\n]+-", re.MULTILINE)
+
+    def __init__(self, pos: int = 0):
+        self._buffer = bytearray()
+        self._head = pos
+        self._scan = pos
+
+    @property
+    def buffer(self): return self._buffer
+
+    def split(self, log_buffer, end: int, is_final: bool) -> Iterable[Tuple[int, int]]:
+        # 完結した行のみを走査する (走査済みの範囲は再走査しない)
+        # (finditer はバッファを掴んだままになるため都度 search する)
+        scan_end = end if is_final else log_buffer.rfind(b"\n", self._scan, end) + 1
+        while self._scan < scan_end:
+            match_res = self.REGEX_LOG_HEADER.search(log_buffer, self._scan, scan_end)
+            if match_res is None:
+                self._scan = scan_end
+                break
+
+            start_pos = match_res.start()
+            self._scan = match_res.end()
+            if start_pos > self._head:
+                head, self._head = self._head, start_pos
+                yield head, start_pos
+
+        # 終端まで読む場合は未確定のレコードも出力
+        if is_final and self._head < end:
+            head, self._head = self._head, end
+            yield head, end
+
+    def feed(self, chunk: bytes) -> Iterable[Tuple[int, int]]:
+        # 出力済みのレコードが溜まったらバッファを詰める
+        # (未確定のレコードより多い場合のみ詰めることで移動量を抑える)
+        if self._head > 0 and self._head * 2 >= len(self._buffer):
+            del self._buffer[:self._head]
+            self._scan -= self._head
+            self._head = 0
+        self._buffer += chunk
+        return self.split(self._buffer, len(self._buffer), False)
+
+    def flush(self) -> Iterable[Tuple[int, int]]:
+        return self.split(self._buffer, len(self._buffer), True)
+
+
+class EventSpillBuffer:
+    # ログインユーザの特定を待つ間のイベントを保持するバッファ
+    # 一定件数まではメモリに保持し、超えた分は一時ファイルへ書き出す
+    MEMORY_LEN = 1024
+
+    def __init__(self, memory_len: int = MEMORY_LEN):
+        self._memory_len = memory_len
+        self._items = list()
+        self._spill = None
+        self._spill_count = 0
+
+    def __len__(self) -> int:
+        return len(self._items) + self._spill_count
+
+    def __iter__(self):
+        yield from self._items
+        if self._spill is not None:
+            self._spill.seek(0)
+            for _ in range(self._spill_count):
+                yield pickle.load(self._spill)
+
+    def append(self, item) -> None:
+        if self._spill is None and len(self._items) < self._memory_len:
+            self._items.append(item)
+            return
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+        self._spill.seek(0, os.SEEK_END)
+        pickle.dump(item, self._spill, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spill_count += 1
+
+    @property
+    def is_spilled(self) -> bool:
+        return self._spill is not None
+
+    def clear(self) -> None:
+        self._items.clear()
+        if self._spill is not None:
+            self._spill.close()
+        self._spill = None
+        self._spill_count = 0
+
 
 class VRChatLogReader:
-    LOG_BUFFER_SIZE = 102_400
-    REGEX_LOG_MSG = re.compile(
-        r"\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}[^-]+-")
-    REGEX_ENTER_WORLD_01 = re.compile(
-        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] Entering Room: (?P<WorldName>[^\n]+)")
-    REGEX_ENTER_WORLD_02 = re.compile(
-        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] Joining (?P<WorldId>(?:wrld_[^:]+)|(?:local)):(?P<InstanceId>[^\n]+)")
-    REGEX_PLAYER_JOINED = re.compile(
-        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] OnPlayerJoined (?P<UserName>[^\n]+)")
-    REGEX_INITIALIZED_API = re.compile(
-        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] Initialized PlayerAPI \"(?P<UserName>.*)\" is (?P<Mode>[^\n]+)")
-    REGEX_PLAYER_LEFT = re.compile(
-        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] OnPlayerLeft (?P<UserName>[^\n]+)")
-    REGEX_LEFT_WORLD = re.compile(
-        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] OnLeftRoom")
-
-    def __init__(self, logfile_path: Path, is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus):
+    LOG_BUFFER_SIZE = 1_073_741_824
+    LOG_CHUNK_SIZE = 1_048_576
+    LOG_PRESCAN_SIZE = 8_388_608
+    # イベント種別ごとのパターン ([Behaviour] 直後のトークン -> 種別, 型, 本文パターン)
+    # 本文パターンのグループ名はイベントのフィールド名と一致させ、無いフィールドは現在のステートで補う
+    EVENT_PATTERNS = {
+        "Entering": (
+            entity.LogEventType.ENTER_WORLD, entity.LogEventEnterWorld,
+            re.compile(r" Room: (?P<world_name>[^\n]+)")),
+        "Joining": (
+            entity.LogEventType.JOIN_INSTANCE, entity.LogEventEnterWorld,
+            re.compile(r" (?P<world_id>(?:wrld_[^:]+)|(?:local)):(?P<instance_id>[^\n]+)")),
+        "OnLeftRoom": (
+            entity.LogEventType.LEFT_WORLD, entity.LogEventLeftWorld,
+            re.compile(r"")),
+        "OnPlayerJoined": (
+            entity.LogEventType.ENTER_PLAYER, entity.LogEventEnterPlayer,
+            re.compile(r" (?P<user_display_name>[^\n]+)")),
+        "OnPlayerLeft": (
+            entity.LogEventType.LEFT_PLAYER, entity.LogEventLeftPlayer,
+            re.compile(r" (?P<user_display_name>[^\n]+)")),
+        "Initialized": (
+            entity.LogEventType.INITIALIZE_API, entity.LogEventInitializedApi,
+            re.compile(r" PlayerAPI \"(?P<user_display_name>.*)\" is (?P<mode>[^\n]+)")),
+    }
+    REGEX_EVENT_HEADER = re.compile(
+        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] (?P<Kind>[A-Za-z]+)")
+    REGEX_PRESCAN_LOCALUSER = re.compile(
+        rb"^\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}[^-\n]+-  \[Behaviour\] Initialized PlayerAPI \"([^\n]*)\" is local\r?$", re.MULTILINE)
+    REGEX_PRESCAN_AUTHUSER = \
+        rb"^\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}[^-\n]+-  \[Behaviour\] User Authenticated: %s(?: \([^\r\n]*\))?\r?$"
+    REGEX_EVENT_KEYWORD = re.compile(
+        rb"\[Behaviour\] (?:" + b"|".join(re.escape(kind.encode()) for kind in EVENT_PATTERNS) + rb")")
+
+    def __init__(self, logfile_path: Path, is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus, follower=None, index=None):
         self._logfile_path = logfile_path
         self._is_read_lastlog = is_read_lastlog
         self._target_user = target_user
         self._status = status
-        self._log_buff = list()
+        self._follower = follower
+        self._index = index
+        self._log_buff = EventSpillBuffer()
 
     def read(self) -> Iterable[entity.LogEvent]:
         try:
             # 未読込み分のみ処理する
             # TODO: 追加分を読む際にAuthUserが取得できないはず
             file_pos = self._status.pos
-            file_sta = self._logfile_path.stat()
-            if file_sta.st_size <= file_pos:
+            if self._follower is None and self.is_read_all(self._logfile_path, file_pos):
                 return
 
             logger.info(f"ログ (\"{str(self._logfile_path)}\") の解析を開始.")
-            log_stream = self._logfile_path.open(mode="r", encoding="utf8", errors="replace")
-            log_stream.seek(file_pos)
             status = dataclasses.replace(self._status)
-            for activity in self.read_log(log_stream, self._is_read_lastlog, self._target_user, status):
-                if status.authuser_display_name != self._target_user:
+
+            # ログインユーザが不明な場合は、ファイルの先頭部分からバイト列のまま探す
+            # 特定できれば対象外のファイルは解析せずに読み飛ばし、対象のファイルはイベントを溜めずに出力する
+            is_authuser_found = status.authuser_display_name == self._target_user
+            if status.authuser_display_name is None:
+                authuser = self.prescan_authuser(self._logfile_path, self._target_user)
+                if authuser is not None and authuser != self._target_user:
+                    raise entity.VRChatLogError(
+                        entity.VRChatLogErrorType.MISS_MATCH_AUTHUSER, "ログ生成時のログインユーザが対象ユーザと異なります"
+                    )
+                is_authuser_found = authuser == self._target_user
+
+            if self._follower is None and is_archive(self._logfile_path):
+                log_items = self.read_archive(self._logfile_path, self._is_read_lastlog, self._target_user, status)
+            elif self._follower is None:
+                log_items = self.read_file(self._logfile_path, self._is_read_lastlog, self._target_user, status)
+            else:
+                # 追跡中のログは書き込まれた分を順次解析
+                log_items = self.read_chunks(self._follower.follow(file_pos), self._is_read_lastlog, self._target_user, status)
+            for activity in log_items:
+                # 一定間隔毎に解析途中の状態を索引へ記録 (再解析の開始位置とする)
+                if self._index is not None:
+                    self._index.add(status, activity.timestamp)
+
+                if status.authuser_display_name != self._target_user and not is_authuser_found:
                     if status.pos >= self.LOG_BUFFER_SIZE:
                         raise entity.VRChatLogError(
                             entity.VRChatLogErrorType.LOG_BUFFER_OVERFLOW,
@@ -122,6 +428,9 @@ class VRChatLogReader:
             if len(self._log_buff) > 0:
                 raise entity.VRChatLogError(
                     entity.VRChatLogErrorType.LOG_BUFFER_OVERFLOW, "ログ生成時のログインユーザを特定できませんでした")
+            # 最後のイベント以降のレコードも読込み済みとする
+            # (圧縮済みのログは全て読み込んだことが記録されないと、毎回先頭から展開し直すことになる)
+            self._status.update(status)
 
         except entity.VRChatLogError as ex:
             self._status.update(status)
@@ -133,28 +442,138 @@ class VRChatLogReader:
                 return
             raise
 
+        finally:
+            self._log_buff.clear()
+
     @staticmethod
-    def read_log(log_stream, is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus) -> Iterable[Tuple[int, str]]:
-        buffer = ""
-        for line in log_stream:
-            buffer += line
-            prev_index = 0
-            for match_res in VRChatLogReader.REGEX_LOG_MSG.finditer(buffer):
-                start_pos = match_res.start()
-                if prev_index != start_pos:
-                    m_txt = buffer[prev_index:start_pos]
-                    activity = VRChatLogReader.proc_logevent_text(m_txt, target_user, status)
-
-                    if activity is not None:
-                        yield activity
+    def prescan_authuser(logfile_path: Path, target_user: str = None) -> str:
+        # ログ生成時のログインユーザ (PlayerAPI の初期化から特定)
+        # 認証ユーザの出力は表示名と一致するとは限らないため、対象ユーザと完全に一致する場合の確認のみに用いる
+        with open_logfile(logfile_path) as log_stream:
+            log_buffer = log_stream.read(VRChatLogReader.LOG_PRESCAN_SIZE)
+        match_res = VRChatLogReader.REGEX_PRESCAN_LOCALUSER.search(log_buffer)
+        if match_res is not None:
+            return match_res.group(1).decode("utf8", errors="replace")
+        if target_user is not None:
+            regex_authuser = VRChatLogReader.REGEX_PRESCAN_AUTHUSER % re.escape(target_user.encode("utf8"))
+            if re.search(regex_authuser, log_buffer, re.MULTILINE) is not None:
+                return target_user
+        return None
+
+    @staticmethod
+    def is_read_all(logfile_path: Path, pos: int) -> bool:
+        # 圧縮済みのログは展開後のサイズと比較 (サイズが記録されていない場合は不明とする)
+        if logfile_path.suffix == ".gz":
+            # gzip は展開後のサイズの下位32ビットのみ記録される
+            with logfile_path.open(mode="rb") as log_stream:
+                log_stream.seek(-4, os.SEEK_END)
+                return pos > 0 and pos % 2 ** 32 == int.from_bytes(log_stream.read(4), "little")
+        elif logfile_path.suffix == ".zst":
+            if zstandard is None:
+                return False
+            with logfile_path.open(mode="rb") as log_stream:
+                size = zstandard.frame_content_size(log_stream.read(18))
+            return size >= 0 and size <= pos
+        return logfile_path.stat().st_size <= pos
 
-                prev_index = start_pos
-            buffer = buffer[prev_index:]
+    @staticmethod
+    def read_archive(logfile_path: Path, is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus) -> Iterable[entity.LogEvent]:
+        # 圧縮済みのログは展開しながら解析する (位置は展開後のバイト数)
+        with open_logfile(logfile_path) as log_stream:
+            log_stream.seek(status.pos)
+            yield from VRChatLogReader.read_log(log_stream, is_read_lastlog, target_user, status)
+
+    @staticmethod
+    def read_file(logfile_path: Path, is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus, segmenter: VRChatLogSegmenter = None) -> Iterable[entity.LogEvent]:
+        # ファイルをメモリマップし、バイト列のまま解析する
+        # (マップできない場合はバイナリストリームとして読み込む)
+        with logfile_path.open(mode="rb") as log_stream:
+            try:
+                with stats.measure("io.mmap"):
+                    log_buffer = mmap.mmap(log_stream.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                log_stream.seek(status.pos)
+                yield from VRChatLogReader.read_log(log_stream, is_read_lastlog, target_user, status, segmenter)
+                return
+
+            with log_buffer:
+                yield from VRChatLogReader.read_buffer(log_buffer, is_read_lastlog, target_user, status, segmenter)
+
+    @staticmethod
+    def read_buffer(log_buffer, is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus, segmenter: VRChatLogSegmenter = None) -> Iterable[entity.LogEvent]:
+        # バッファ上の位置がそのままファイル上の位置となる
+        segmenter = segmenter or VRChatLogSegmenter(status.pos)
+        records = segmenter.split(log_buffer, len(log_buffer), is_read_lastlog)
+        yield from VRChatLogReader.read_records(log_buffer, records, target_user, status)
+
+    @staticmethod
+    def read_log(log_stream, is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus, segmenter: VRChatLogSegmenter = None) -> Iterable[entity.LogEvent]:
+        chunks = iter(lambda: VRChatLogReader.read_chunk(log_stream), b"")
+        yield from VRChatLogReader.read_chunks(chunks, is_read_lastlog, target_user, status, segmenter)
+
+    @staticmethod
+    def read_chunk(log_stream) -> bytes:
+        time_start = time.perf_counter()
+        chunk = log_stream.read(VRChatLogReader.LOG_CHUNK_SIZE)
+        stats.add("io.read", time.perf_counter() - time_start, 1, len(chunk))
+        return chunk
+
+    @staticmethod
+    def read_chunks(chunks: Iterable[bytes], is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus, segmenter: VRChatLogSegmenter = None) -> Iterable[entity.LogEvent]:
+        # 未確定のレコードはセグメンタに保持され、次のチャンクと繋げて解析される
+        segmenter = segmenter or VRChatLogSegmenter()
+        for chunk in chunks:
+            yield from VRChatLogReader.read_records(segmenter.buffer, segmenter.feed(chunk), target_user, status)
 
         if is_read_lastlog:
-            activity = VRChatLogReader.proc_logevent_text(buffer, target_user, status)
-            if activity is not None:
-                yield activity
+            yield from VRChatLogReader.read_records(segmenter.buffer, segmenter.flush(), target_user, status)
+
+    @staticmethod
+    def read_records(log_buffer, records: Iterable[Tuple[int, int]], target_user: str, status: entity.LogParserStatus) -> Iterable[entity.LogEvent]:
+        # (デコードを含むパースの所要時間は呼び出し単位で計上)
+        elapsed = 0.0
+        count = 0
+        size = 0
+        try:
+            for start, end in VRChatLogReader.filter_records(log_buffer, records, status):
+                time_start = time.perf_counter()
+                activity = VRChatLogReader.proc_logevent(log_buffer, start, end, target_user, status)
+                elapsed += time.perf_counter() - time_start
+                count += 1
+                size += end - start
+                if activity is not None:
+                    yield activity
+        finally:
+            stats.add("parse", elapsed, count, size, "chunk")
+
+    @staticmethod
+    def filter_records(log_buffer, records: Iterable[Tuple[int, int]], status: entity.LogParserStatus) -> Iterable[Tuple[int, int]]:
+        # 解析対象のキーワードを含まないレコードはデコードせずに読み飛ばす
+        # (レコード毎に計測すると負荷が大きいため、区切り・絞り込みの所要時間は呼び出し元へ返している間を除いて計上。追跡中は書込み待ちを含む)
+        time_start = time.perf_counter()
+        time_yield = 0.0
+        count = 0
+        size = 0
+        try:
+            for start, end in records:
+                count += 1
+                size += end - start
+                if VRChatLogReader.REGEX_EVENT_KEYWORD.search(log_buffer, start, end) is None:
+                    status.pos += end - start
+                    continue
+                time_yield_start = time.perf_counter()
+                yield start, end
+                time_yield += time.perf_counter() - time_yield_start
+        finally:
+            stats.add("scan", time.perf_counter() - time_start - time_yield, count, size, "chunk")
+
+    @staticmethod
+    def proc_logevent(log_buffer, start: int, end: int, target_user: str, status: entity.LogParserStatus) -> entity.LogEvent:
+        # 解析対象のレコードのみデコードし、位置はバッファ上のバイト数で進める
+        text = log_buffer[start:end].decode("utf8", errors="replace")
+        activity = VRChatLogReader.proc_logevent_text(text, target_user, status)
+        status.pos += end - start
+        return activity
 
     @staticmethod
     def proc_logevent_text(text: str, target_user: str, status: entity.LogParserStatus) -> entity.LogEvent:
@@ -215,90 +634,612 @@ class VRChatLogReader:
                     )
 
         # パースされたログを出力
-        status.pos += len(text.encode("utf8"))
         return activity
 
     @staticmethod
     def parse_activity(log_item: str, status: entity.LogParserStatus) -> entity.LogEvent:
         if log_item == "" or log_item[34:45] != "[Behaviour]":
             return None
-        elif match_res := VRChatLogReader.REGEX_ENTER_WORLD_01.match(log_item):
-            timestamp = match_res.group("Timestamp")
-            worldName = match_res.group("WorldName")
-            timestamp = datetime.datetime.strptime(timestamp, "%Y.%m.%d %H:%M:%S")
-            return entity.LogEventEnterWorld(
-                type=entity.LogEventType.ENTER_WORLD,
-                timestamp=timestamp,
-                instance_id=status.current_instance_id,
-                world_id=status.current_world_id,
-                world_name=worldName
-            )
-        elif match_res := VRChatLogReader.REGEX_ENTER_WORLD_02.match(log_item):
-            timestamp = match_res.group("Timestamp")
-            instance_id = match_res.group("InstanceId")
-            world_id = match_res.group("WorldId")
-            timestamp = datetime.datetime.strptime(timestamp, "%Y.%m.%d %H:%M:%S")
-            return entity.LogEventEnterWorld(
-                type=entity.LogEventType.JOIN_INSTANCE,
-                timestamp=timestamp,
-                instance_id=instance_id,
-                world_id=world_id,
-                world_name=status.current_world_name
-            )
-        elif match_res := VRChatLogReader.REGEX_LEFT_WORLD.match(log_item):
-            timestamp = match_res.group("Timestamp")
-            timestamp = datetime.datetime.strptime(timestamp, "%Y.%m.%d %H:%M:%S")
-            return entity.LogEventLeftWorld(
-                type=entity.LogEventType.LEFT_WORLD,
-                timestamp=timestamp,
-                instance_id=status.current_instance_id,
-                world_id=status.current_world_id,
-                world_name=status.current_world_name
-            )
-        elif match_res := VRChatLogReader.REGEX_PLAYER_JOINED.match(log_item):
-            timestamp = match_res.group("Timestamp")
-            userName = match_res.group("UserName")
-            timestamp = datetime.datetime.strptime(timestamp, "%Y.%m.%d %H:%M:%S")
-            return entity.LogEventEnterPlayer(
-                type=entity.LogEventType.ENTER_PLAYER,
-                timestamp=timestamp,
-                instance_id=status.current_instance_id,
-                world_id=status.current_world_id,
-                world_name=status.current_world_name,
-                user_display_name=userName
-            )
-        elif match_res := VRChatLogReader.REGEX_PLAYER_LEFT.match(log_item):
-            timestamp = match_res.group("Timestamp")
-            userName = match_res.group("UserName")
-            timestamp = datetime.datetime.strptime(timestamp, "%Y.%m.%d %H:%M:%S")
-            return entity.LogEventLeftPlayer(
-                type=entity.LogEventType.LEFT_PLAYER,
-                timestamp=timestamp,
-                instance_id=status.current_instance_id,
-                world_id=status.current_world_id,
-                world_name=status.current_world_name,
-                user_display_name=userName
-            )
-        elif match_res := VRChatLogReader.REGEX_INITIALIZED_API.match(log_item):
-            timestamp = match_res.group("Timestamp")
-            userName = match_res.group("UserName")
-            api_mode = match_res.group("Mode")
-            timestamp = datetime.datetime.strptime(timestamp, "%Y.%m.%d %H:%M:%S")
-            return entity.LogEventInitializedApi(
-                type=entity.LogEventType.INITIALIZE_API,
-                timestamp=timestamp,
-                instance_id=status.current_instance_id,
-                world_id=status.current_world_id,
-                world_name=status.current_world_name,
-                user_display_name=userName,
-                mode=api_mode
-            )
-        else:
+
+        # 共通部分を一度だけ照合し、イベント種別に対応するパターンのみ照合する
+        match_res = VRChatLogReader.REGEX_EVENT_HEADER.match(log_item)
+        if match_res is None:
+            return None
+        event_pattern = VRChatLogReader.EVENT_PATTERNS.get(match_res.group("Kind"))
+        if event_pattern is None:
             return None
+        event_type, event_class, regex_body = event_pattern
+        match_body = regex_body.match(log_item, match_res.end())
+        if match_body is None:
+            return None
+
+        # ワールド・インスタンス・ユーザの名前は多数のイベントで重複するため intern して共有
+        # (ステートにも同じ文字列が引き継がれ、以降のイベントはその参照を保持)
+        timestamp = VRChatLogReader.parse_timestamp(match_res.group("Timestamp"))
+        fields = {
+            "instance_id": status.current_instance_id,
+            "world_id": status.current_world_id,
+            "world_name": status.current_world_name
+        }
+        fields.update((key, sys.intern(val)) for key, val in match_body.groupdict().items())
+        # (辞書の順序はイベントのフィールド順と一致するため、キーワード引数より速い位置引数で生成)
+        return event_class(event_type, timestamp, *fields.values())
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def parse_timestamp(text: str) -> datetime.datetime:
+        # 固定長 ("%Y.%m.%d %H:%M:%S") のため strptime を使わず切り出して変換
+        # (連続するログは同じ時刻を持つことが多いため結果をキャッシュ)
+        return datetime.datetime(
+            int(text[0:4]), int(text[5:7]), int(text[8:10]),
+            int(text[11:13]), int(text[14:16]), int(text[17:19])
+        )
+
+
+class VRChatLogWatcher:
+    IN_MODIFY = 0x00000002
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    EVENT_HEADER = struct.Struct("iIII")
+    POLL_INTERVAL_SEC = 1.0
+
+    def __init__(self, log_dir: Path):
+        # Linux では inotify でディレクトリの変化を待つ (利用できない場合はポーリング)
+        self._fd = None
+        if sys.platform.startswith("linux"):
+            try:
+                self._fd = self._inotify_open(log_dir)
+            except (OSError, AttributeError) as ex:
+                logger.warning(f"inotify を利用できないため、ポーリングでログを監視します ({ex}).")
+
+    @property
+    def is_polling(self): return self._fd is None
+
+    def wait(self, timeout_sec: float) -> bool:
+        # 新しいログが作成された可能性があれば True
+        # (ポーリングでは判別できないため常に True)
+        if self._fd is None:
+            time.sleep(min(self.POLL_INTERVAL_SEC, timeout_sec))
+            return True
+
+        readable, _, _ = select.select([self._fd], [], [], timeout_sec)
+        if len(readable) == 0:
+            return False
+        buffer = bytearray()
+        try:
+            while True:
+                data = os.read(self._fd, 4096)
+                if not data:
+                    break
+                buffer += data
+        except BlockingIOError:
+            pass
+        return self.is_created(buffer)
+
+    @staticmethod
+    def is_created(buffer: bytes) -> bool:
+        # inotify_event (wd, mask, cookie, len, name[len]) の並びから作成・移動のイベントを探す
+        header = VRChatLogWatcher.EVENT_HEADER
+        mask_created = VRChatLogWatcher.IN_CREATE | VRChatLogWatcher.IN_MOVED_TO | VRChatLogWatcher.IN_Q_OVERFLOW
+        offset = 0
+        while offset + header.size <= len(buffer):
+            _, mask, _, name_len = header.unpack_from(buffer, offset)
+            if mask & mask_created:
+                return True
+            offset += header.size + name_len
+        return False
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @staticmethod
+    def _inotify_open(log_dir: Path) -> int:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        mask = VRChatLogWatcher.IN_MODIFY | VRChatLogWatcher.IN_MOVED_TO | VRChatLogWatcher.IN_CREATE
+        wd = libc.inotify_add_watch(fd, os.fsencode(str(log_dir)), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, "inotify_add_watch に失敗しました")
+        return fd
+
+
+class VRChatLogFollower:
+    def __init__(self, logfile_path: Path, watcher: VRChatLogWatcher, idle_sec: float, on_idle=None, check_interval_sec: float = 0.0):
+        self._logfile_path = logfile_path
+        self._watcher = watcher
+        self._idle_sec = idle_sec
+        self._on_idle = on_idle
+        self._check_interval_sec = check_interval_sec
+
+    def follow(self, pos: int) -> Iterable[bytes]:
+        # 書き込まれた分をチャンクとして出力し、より新しいログが作成されるまで追跡する
+        # (ログの切り替わりは、inotify ではファイルの作成・移動の通知時のみ、ポーリングでは一定間隔で確認)
+        with self._logfile_path.open(mode="rb") as log_stream:
+            log_stream.seek(pos)
+            time_last = time.monotonic()
+            time_checked = None
+            is_idle = False
+            is_created = True
+            while True:
+                chunk = log_stream.read(VRChatLogReader.LOG_CHUNK_SIZE)
+                if chunk:
+                    time_last = time.monotonic()
+                    is_idle = False
+                    yield chunk
+                    continue
+
+                time_now = time.monotonic()
+                if is_created and (not self._watcher.is_polling or time_checked is None or time_now - time_checked >= self._check_interval_sec):
+                    time_checked = time_now
+                    is_created = False
+                    if self.is_rotated():
+                        # 切り替わる前に書き込まれた分を読み切って終了
+                        yield from iter(lambda: log_stream.read(VRChatLogReader.LOG_CHUNK_SIZE), b"")
+                        return
+
+                # 一定時間書き込みが無ければ通知 (書き込みが再開されるまで一度のみ)
+                if not is_idle and time_now - time_last >= self._idle_sec:
+                    is_idle = True
+                    if self._on_idle is not None:
+                        self._on_idle()
+                is_created |= self._watcher.wait(self._idle_sec)
+
+    def is_rotated(self) -> bool:
+        latest = find_latest_logfile(self._logfile_path.parent)
+        return latest is not None and latest != self._logfile_path
+
+
+class ActivityOutbox:
+    # DB へ転送する前のアクティビティを保持する SQLite のファイル
+    # 書込み先に接続できない間も解析を継続し、転送は後から再開する
+    EVENT_CLASSES = {
+        cls.__name__: cls for cls in (
+            entity.LogEventEnterWorld, entity.LogEventLeftWorld,
+            entity.LogEventEnterPlayer, entity.LogEventLeftPlayer, entity.LogEventInitializedApi)
+    }
+
+    def __init__(self, outbox_path: Path):
+        outbox_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(outbox_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS dead_letter (id INTEGER PRIMARY KEY, event TEXT NOT NULL, error TEXT, failed_at TEXT NOT NULL)")
+
+    def put(self, activities: list[entity.LogEvent]) -> None:
+        # 1トランザクションで追記 (戻った時点で永続化済み)
+        rows = [(self.event_enc(activity),) for activity in activities]
+        with self._lock, stats.measure("outbox.put", len(rows)):
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT INTO outbox (event) VALUES (?)", rows)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def peek(self, limit: int) -> list[Tuple[int, entity.LogEvent]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, event FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(row_id, self.event_dec(event)) for row_id, event in rows]
+
+    def remove(self, max_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id <= ?", (max_id,))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_letter(self, row_id: int, error: str) -> None:
+        # 転送できないアクティビティは送信箱から外し、調査用に別のテーブルへ残す
+        failed_at = datetime.datetime.now().astimezone().isoformat()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead_letter (id, event, error, failed_at) SELECT id, event, ?, ? FROM outbox WHERE id = ?",
+                    (error, failed_at, row_id))
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def count_dead_letter(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def event_enc(activity: entity.LogEvent) -> str:
+        values = dataclasses.astuple(activity)
+        return json.dumps(
+            [type(activity).__name__, activity.type.name, activity.timestamp.isoformat(), *values[2:]],
+            ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def event_dec(text: str) -> entity.LogEvent:
+        name, event_type, timestamp, *values = json.loads(text)
+        return ActivityOutbox.EVENT_CLASSES[name](
+            entity.LogEventType[event_type], datetime.datetime.fromisoformat(timestamp), *values)
+
+
+class ActivityUploader:
+    # 送信箱に溜めたアクティビティを、解析と並行して DB へ転送
+    # 転送に失敗した場合は間隔を空けながら再試行し、送信箱から消えるまで転送を続ける
+    # 一時的でないエラーの場合は1件ずつ転送し直し、転送できないアクティビティは送信箱から外す
+    BACKOFF_SEC = 1.0
+    BACKOFF_MAX_SEC = 60.0
+
+    def __init__(self, dynamo_store: dynamodb.Service, outbox: ActivityOutbox, workers: int, batch_len: int):
+        self._dynamo = dynamo_store
+        self._outbox = outbox
+        self._batch_len = batch_len
+        self._executor = ThreadPoolExecutor(max(1, workers))
+        self._workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._drained = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, activities: list[entity.LogEvent]) -> None:
+        with self._lock:
+            self._outbox.put(activities)
+            self._drained.clear()
+        self._wakeup.set()
+
+    def wait(self, timeout_sec: float = None) -> bool:
+        # 送信箱が空になるまで待機 (時間内に空にならなければ False)
+        return self._drained.wait(timeout_sec)
+
+    def close(self) -> None:
+        self._closed.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _put_activities(self, activities: list[entity.LogEvent]) -> None:
+        with stats.measure("upload", len(activities)):
+            self._dynamo.put_activities(activities)
+
+    def _run(self) -> None:
+        retry = 0
+        while not self._closed.is_set():
+            with self._lock:
+                rows = self._outbox.peek(self._batch_len * self._workers)
+                if len(rows) == 0:
+                    self._drained.set()
+                    self._wakeup.clear()
+            if len(rows) == 0:
+                self._wakeup.wait()
+                continue
+
+            try:
+                self._upload(rows)
+                retry = 0
+            except Exception as ex:
+                delay = min(self.BACKOFF_MAX_SEC, self.BACKOFF_SEC * 2 ** retry)
+                logger.warning(f"アクティビティの転送に失敗 ({delay:.0f}秒後に再試行): {ex}")
+                retry += 1
+                self._closed.wait(delay)
+
+    def _upload(self, rows: list[Tuple[int, entity.LogEvent]]) -> None:
+        # 複数の一括書込みを並行して実行し、全て完了した分を送信箱から削除
+        # (失敗時は全件を再送するが、同一キーへの上書きとなるため重複はしない)
+        try:
+            activities = [activity for _, activity in rows]
+            batches = [activities[i:i + self._batch_len] for i in range(0, len(activities), self._batch_len)]
+            list(self._executor.map(self._put_activities, batches))
+        except Exception as ex:
+            if self.is_retryable(ex):
+                raise
+            logger.warning(f"アクティビティの転送に失敗 (一時的なエラーではないため1件ずつ転送し直します): {ex}")
+            for row_id, activity in rows:
+                try:
+                    self._put_activities([activity])
+                except Exception as ex_row:
+                    if self.is_retryable(ex_row):
+                        raise
+                    logger.error(f"アクティビティを転送できないため送信箱から外します ({activity}): {ex_row}")
+                    self._outbox.dead_letter(row_id, str(ex_row))
+        self._outbox.remove(rows[-1][0])
+
+    @staticmethod
+    def is_retryable(ex: Exception) -> bool:
+        # 要求の内容に起因するエラーは再試行しても成功しない
+        # (DynamoDB のエラーはスロットリング等の一時的なもののみ、それ以外は接続エラー等として再試行)
+        if isinstance(ex, ClientError):
+            return ex.response.get("Error", dict()).get("Code") in dynamodb.Service.RETRY_ERROR_CODES
+        return not isinstance(ex, (ParamValidationError, ValueError, TypeError, KeyError))
+
+
+class ParserStateIndex:
+    # ログファイル毎に、一定間隔で解析途中の状態を記録した疎な索引
+    # 記録した位置から解析を再開すれば、ファイルの先頭から解析した場合と同じ状態となる
+    INDEX_INTERVAL = 16 * 1_048_576
+
+    def __init__(self, index_path: Path, interval: int = INDEX_INTERVAL):
+        self._index_path = index_path
+        self._interval = interval
+        self._entries: list[Tuple[datetime.datetime, entity.LogParserStatus]] = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self.load()
+        return self._entries
+
+    def load(self) -> list[Tuple[datetime.datetime, entity.LogParserStatus]]:
+        entries = list()
+        try:
+            with self._index_path.open(mode="r", encoding="utf8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError as ex:
+                        # 追記中に中断された末尾の行は無視
+                        break
+                    entries.append((datetime.datetime.fromisoformat(item[0]), entity.LogParserStatus(*item[1:])))
+        except FileNotFoundError as ex:
+            pass
+        return entries
+
+    def reset(self) -> None:
+        # ログが置き換えられた場合等、最初から解析し直す際に記録を破棄
+        self._index_path.unlink(missing_ok=True)
+        self._entries = list()
+
+    def add(self, status: entity.LogParserStatus, timestamp: datetime.datetime) -> None:
+        # 最後の記録から一定以上進んだ場合のみ追記
+        last_pos = self.entries[-1][1].pos if len(self.entries) > 0 else 0
+        if status.pos - last_pos < self._interval:
+            return
+
+        entry = (timestamp, dataclasses.replace(status))
+        self._index_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._index_path.open(mode="a", encoding="utf8", newline="\n") as f:
+            f.write(json.dumps([timestamp.isoformat(), *dataclasses.astuple(status)], ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.entries.append(entry)
+
+    def find(self, pos: int = None, timestamp: datetime.datetime = None) -> entity.LogParserStatus:
+        # 指定位置 (時刻) より前で最も近い記録を取得 (無ければファイルの先頭)
+        # (記録はその時刻のイベントの直後の状態のため、同じ時刻の記録からは再開しない)
+        status = entity.LogParserStatus(0, 0, None, None, None, None)
+        for entry_time, entry_status in self.entries:
+            if pos is not None and entry_status.pos > pos:
+                break
+            if timestamp is not None and entry_time >= timestamp:
+                break
+            status = entry_status
+        return dataclasses.replace(status)
+
+
+class AdaptiveBatchWriter:
+    # 一括書込みを複数並行して行い、並行数をスロットリングと消費キャパシティに応じて増減する
+    # (スロットリングが発生するか上限を超えれば半減し、それ以外は1ずつ増やす)
+    def __init__(self, dynamo_store: dynamodb.Service, max_workers: int, max_capacity: float, retention: datetime.timedelta, batch_len: int):
+        self._dynamo = dynamo_store
+        self._max_workers = max(1, max_workers)
+        self._max_capacity = max_capacity
+        self._retention = retention
+        self._batch_len = batch_len
+        self._concurrency = 1
+        self._executor = ThreadPoolExecutor(self._max_workers)
+        self.item_count = 0
+        self.consumed_capacity = 0.0
+
+    @property
+    def concurrency(self): return self._concurrency
+    @property
+    def round_len(self): return self._concurrency * self._batch_len
+
+    def write(self, activities: list[entity.LogEvent]) -> None:
+        # 全ての一括書込みが完了するまで戻らない
+        if len(activities) == 0:
+            return
+        time_start = time.monotonic()
+        batches = [activities[i:i + self._batch_len] for i in range(0, len(activities), self._batch_len)]
+        results = list(self._executor.map(self._put_activities, batches))
+        elapsed = time.monotonic() - time_start
+
+        consumed = sum(res.consumed_capacity for res in results)
+        throttle_count = sum(res.throttle_count for res in results)
+        self.item_count += sum(res.item_count for res in results)
+        self.consumed_capacity += consumed
+
+        # 消費キャパシティが上限を超えた場合は、平均が上限に収まるまで待機
+        is_over = False
+        if self._max_capacity > 0:
+            wait_sec = consumed / self._max_capacity - elapsed
+            is_over = wait_sec > 0
+            if is_over:
+                time.sleep(wait_sec)
+
+        if throttle_count > 0 or is_over:
+            self._concurrency = max(1, self._concurrency // 2)
+        elif self._concurrency < self._max_workers:
+            self._concurrency += 1
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _put_activities(self, activities: list[entity.LogEvent]) -> dynamodb.BatchWriteResult:
+        with stats.measure("upload", len(activities)):
+            return self._dynamo.put_activities(activities, self._retention)
+
+
+class CheckpointStore:
+    JOURNAL_COMPACT_SIZE = 65_536
+    GENERATION_KEY = "#snapshot"
+
+    def __init__(self, checkpoint_dir: Path, profile: str):
+        self._checkpoint_dir = checkpoint_dir.resolve()
+        self._snapshot_path = self._checkpoint_dir / f"{profile}.json"
+        self._journal_path = self._checkpoint_dir / f"{profile}.journal"
+        self._persisted: dict[str, tuple] = None
+        self._generation: str = None
+
+    def load(self) -> dict[str, entity.LogParserStatus]:
+        # スナップショットに追記型のジャーナルを順に適用して復元
+        # (ジャーナルは先頭行に記録した元のスナップショットの識別子が一致する場合のみ適用し、統合前の古いジャーナルは破棄する)
+        try:
+            cp_text = self._snapshot_path.read_text(encoding="utf8")
+            value = json.loads(cp_text, object_hook=self.json_dec)
+            self._generation = self.get_generation(cp_text)
+        except FileNotFoundError as ex:
+            value = dict()
+            self._generation = None
+
+        try:
+            # (識別子の無い従来のジャーナルは、読み込んだスナップショットに対するものとして扱う)
+            journal = list()
+            generation = self._generation
+            with self._journal_path.open(mode="r", encoding="utf8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError as ex:
+                        # 追記中に中断された末尾の行は無視
+                        break
+                    if item[0] == self.GENERATION_KEY:
+                        generation = item[1]
+                    else:
+                        journal.append(item)
+            if generation != self._generation:
+                logger.warning(f"チェックポイントのジャーナル (\"{self._journal_path}\") はスナップショットより古いため破棄します.")
+                journal = list()
+                self._journal_path.unlink(missing_ok=True)
+            for item in journal:
+                if len(item) == 1:
+                    value.pop(item[0], None)
+                else:
+                    value[item[0]] = entity.LogParserStatus(*item[1:])
+        except FileNotFoundError as ex:
+            pass
+
+        self._persisted = {key: dataclasses.astuple(val) for key, val in value.items()}
+        return value
+
+    def save(self, value: dict[str, entity.LogParserStatus]) -> None:
+        with stats.measure("checkpoint.save", len(value)):
+            self._save(value)
+
+    def _save(self, value: dict[str, entity.LogParserStatus]) -> None:
+        # 前回の保存から変化したファイル分のみジャーナルへ追記
+        if self._persisted is None:
+            self.compact(value)
+            return
+
+        current = {key: dataclasses.astuple(val) for key, val in value.items()}
+        lines = [
+            json.dumps([key, *val], ensure_ascii=False, separators=(",", ":"))
+            for key, val in current.items() if self._persisted.get(key) != val
+        ]
+        lines.extend(
+            json.dumps([key], ensure_ascii=False, separators=(",", ":"))
+            for key in self._persisted.keys() if key not in current
+        )
+        if len(lines) == 0:
+            return
+
+        self._checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        with self._journal_path.open(mode="a", encoding="utf8", newline="\n") as f:
+            if f.tell() == 0:
+                lines.insert(0, json.dumps([self.GENERATION_KEY, self._generation], separators=(",", ":")))
+            f.write("".join(f"{line}\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+            journal_size = f.tell()
+        self._persisted = current
+
+        if journal_size >= self.JOURNAL_COMPACT_SIZE:
+            self.compact(value)
+
+    def compact(self, value: dict[str, entity.LogParserStatus]) -> None:
+        # スナップショットを一時ファイルへ書き出してから置き換え、ジャーナルを破棄
+        # (置き換え後に中断されても、残ったジャーナルは元のスナップショットが異なるため適用されない)
+        self._checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._snapshot_path.with_suffix(".tmp")
+        cp_text = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=self.json_enc)
+        with tmp_path.open(mode="w", encoding="utf8") as f:
+            f.write(cp_text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path)
+        self._fsync_dir()
+        self._journal_path.unlink(missing_ok=True)
+        self._generation = self.get_generation(cp_text)
+        self._persisted = {key: dataclasses.astuple(val) for key, val in value.items()}
+
+    @staticmethod
+    def get_generation(cp_text: str) -> str:
+        # スナップショットの内容から識別子を求める
+        return hashlib.blake2b(cp_text.encode("utf8"), digest_size=16).hexdigest()
+
+    def _fsync_dir(self) -> None:
+        # Windows ではディレクトリを開けないため省略
+        if os.name == "nt":
+            return
+        fd = os.open(self._checkpoint_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def json_dec(o):
+        if "_type" not in o:
+            return o
+
+        typ = o["_type"]
+        if typ == "LogParserStatus":
+            return entity.LogParserStatus(
+                o["Pos"],
+                o["VisitedWorldCount"],
+                o["AuthUserDisplayName"],
+                o["CurrentWorldId"],
+                o["CurrentWorldName"],
+                o["CurrentInstanceId"],
+                o.get("Fingerprint")
+            )
+
+    @staticmethod
+    def json_enc(o):
+        if isinstance(o, entity.LogParserStatus):
+            return {
+                "_type": "LogParserStatus",
+                "Pos": o.pos,
+                "VisitedWorldCount": o.visited_world_count,
+                "AuthUserDisplayName": o.authuser_display_name,
+                "CurrentWorldId": o.current_world_id,
+                "CurrentWorldName": o.current_world_name,
+                "CurrentInstanceId": o.current_instance_id,
+                "Fingerprint": o.fingerprint
+            }
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
 
 
 class App:
-    SET_STATUS_INTERVAL = datetime.timedelta(seconds=20)
+    SET_STATUS_INTERVAL = datetime.timedelta(seconds=1)
+    WATCH_IDLE_SEC = 2.0
+    UPLOAD_BATCH_LEN = 25
+    UPLOAD_WAIT_SEC = 30.0
+    PROGRESS_INTERVAL = datetime.timedelta(seconds=5)
 
     def __init__(self, app_get_dir: Path, app_put_dir: Path, profile: str):
         self._app_get_dir = app_get_dir
@@ -314,8 +1255,14 @@ class App:
         self._put_table_name = config.get(f"profile.{profile}", "put_table_name")
         self._put_queue_name = config.get(f"profile.{profile}", "put_queue_name")
         self._is_enabled_ewq = config.get(f"profile.{profile}", "enqueue_worker_queue") == "enabled"
-        self._status = self.get_status(app_get_dir, profile)
+        self._checkpoint = CheckpointStore(app_put_dir / "checkpoint", profile)
+        self._status = self._checkpoint.load()
+        self._outbox_path = app_put_dir / "outbox" / f"{profile}.sqlite3"
+        self._enqueue_path = app_put_dir / "outbox" / f"{profile}.enqueue"
+        self._index_dir = app_put_dir / "index" / profile
         self._check_interval_sec = int(config.get(f"profile.{profile}", "check_interval_sec"))
+        self._parse_workers = int(config.get(f"profile.{profile}", "parse_workers", fallback="1"))
+        self._upload_workers = int(config.get(f"profile.{profile}", "upload_workers", fallback="2"))
 
         aws_access_key_id = config.get(f"profile.{profile}", "aws_access_key_id")
         aws_secret_access_key = config.get(f"profile.{profile}", "aws_secret_access_key")
@@ -329,105 +1276,419 @@ class App:
     @property
     def log_dir(self): return self._logdir
     @property
+    def index_dir(self): return self._index_dir
+    @property
+    def parse_workers(self): return self._parse_workers
+    @property
+    def upload_workers(self): return self._upload_workers
+    @property
     def get_table_name(self): return self._get_table_name
     @property
     def put_table_name(self): return self._put_table_name
     @property
     def aws_sess(self): return self._aws_sess
 
-    def init(self, vrc_client: VRChatResource, dynamo_store: dynamodb.Service):
+    def init(self, vrc_client: VRChatResource, dynamo_store: dynamodb.Service, stats_path: Path = None):
         self._vrc = vrc_client
         self._dynamo = dynamo_store
+        self._stats_path = stats_path
+        self._activities = list()
+        self._outbox: ActivityOutbox = None
+        self._uploader: ActivityUploader = None
 
     def invoke(self):
         logger.info("ログ解析処理を開始")
+        stats.pop()
 
         # 各ログファイルの読込み済みバイト数の記録を取得
         # 存在しないログファイルの読込み済みバイト数の記録は削除
-        self._status = {
-            f.name: self._status.get(f.name) or entity.LogParserStatus(0, 0, None, None, None, None)
-            for f in self._logdir.glob("output_log_*.txt") if f.is_file()
-        }
+        self._status = self.match_status(self._logdir, self._status, self._index_dir)
 
         # 各ログファイルを処理
         old_time = datetime.datetime.min
         count = 0
         is_modified = False
         is_moveworld = False
-        for activity in self._vrc.read_log(self._account_name, self._status):
-            # DB へアクティビティを転送
-            self._dynamo.put_activity(activity)
+        self.open_uploader()
+        try:
+            for activity in self._vrc.read_log(self._account_name, self._status):
+                count += 1
+                is_modified = True
+                is_moveworld |= activity.type == entity.LogEventType.ENTER_WORLD or activity.type == entity.LogEventType.LEFT_WORLD
 
-            # 進捗を記録 (途中。10秒置きに記録)
-            newTime = datetime.datetime.now()
-            if newTime - old_time > self.SET_STATUS_INTERVAL:
-                self.set_status(self._app_put_dir, self._profile, self._status)
-                old_time = newTime
+                # アクティビティを送信箱へ一括で書込み (DB への転送は別スレッドで行い解析を継続)
+                # 次のログを読込む前に書込むため、この時点の進捗は送信箱の内容と一致する
+                self._activities.append(activity)
+                if len(self._activities) < self.UPLOAD_BATCH_LEN:
+                    continue
+                self.flush_activities()
 
-            count += 1
-            is_modified = True
-            is_moveworld |= activity.type == entity.LogEventType.ENTER_WORLD or activity.type == entity.LogEventType.LEFT_WORLD
+                # 進捗を記録 (途中。差分のみ追記するため1秒置きに記録)
+                newTime = datetime.datetime.now()
+                if newTime - old_time > self.SET_STATUS_INTERVAL:
+                    self._checkpoint.save(self._status)
+                    old_time = newTime
 
-        # 進捗を記録 (最後)
+            # 進捗を記録 (最後)
+            self.flush_activities()
+            if is_modified:
+                self._checkpoint.save(self._status)
+            is_drained = self.wait_uploader()
+        finally:
+            self.close_uploader()
         print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} ... ログをアップロード ({count} 件)")
-        if is_modified:
-            self.set_status(self._app_put_dir, self._profile, self._status)
-        if is_moveworld and self._is_enabled_ewq:
-            print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} ... Worker へキューイング")
-            logger.info(f"Worker ({self._put_queue_name}) へキューイング")
-            srv = sqs.WorkerService(self._account_id, self._put_queue_name, self._aws_sess, logger)
-            srv.enqueue()
+        self.enqueue_worker(is_moveworld, is_drained)
 
         logger.info(f"ログ解析処理を完了 ({count} 件)")
+        self.report_stats()
 
     @staticmethod
-    def get_status(app_dir: Path, profile: str) -> dict[str, entity.LogParserStatus]:
-        cp_filepath = app_dir / f"checkpoint/{profile}.json"
-        cp_filepath = cp_filepath.resolve()
+    def match_status(log_dir: Path, old_value: dict[str, entity.LogParserStatus], index_dir: Path = None) -> dict[str, entity.LogParserStatus]:
+        # ログファイルを先頭部分の内容で識別し、読込み済みバイト数の記録と対応付ける
+        # (名前の変わったログは記録を引き継ぎ、同じ内容のログは1つのみ解析する)
+        # (最初から解析し直すログは、解析状態の索引も破棄する)
+        # (記録時のファイルが小さかった場合も対応付けられるよう、記録時の長さ毎に先頭部分の識別子で引く)
+        names_by_size: dict[int, dict[str, str]] = dict()
+        for name, val in old_value.items():
+            size = int(val.fingerprint.split(":", 1)[0]) if val.fingerprint is not None else 0
+            if size > 0:
+                names_by_size.setdefault(size, dict())[val.fingerprint] = name
+        fingerprints = set()
+        value = dict()
+        for logfile_path in find_logfiles(log_dir):
+            try:
+                log_head = read_log_head(logfile_path)
+            except Exception as ex:
+                logger.warning(f"ログ (\"{logfile_path}\") を読込めません. 解析しません.\n{get_stacktrace()}\n")
+                continue
+            fingerprint = get_fingerprint(log_head)
+            file_size = logfile_path.stat().st_size if not is_archive(logfile_path) else None
+
+            status = old_value.get(logfile_path.name)
+            is_reset = False
+            if status is not None and not is_same_logfile(log_head, status.fingerprint):
+                logger.warning(f"ログ (\"{logfile_path}\") の内容が置き換えられています. 最初から解析します.")
+                status = None
+                is_reset = True
+            elif status is not None and file_size is not None and file_size < status.pos:
+                logger.warning(f"ログ (\"{logfile_path}\") が切り詰められています. 最初から解析します.")
+                status = None
+                is_reset = True
+            old_name = None
+            if status is None:
+                for size, names in names_by_size.items():
+                    name = names.get(get_fingerprint(log_head[:size])) if len(log_head) >= size else None
+                    if name is not None and (file_size is None or old_value[name].pos <= file_size):
+                        old_name = name
+                        break
+            if old_name is not None:
+                logger.info(f"ログ (\"{logfile_path}\") は解析済みのログと同じ内容です. 記録を引き継ぎます.")
+                status = dataclasses.replace(old_value[old_name])
+                is_reset = False
+
+            if fingerprint in fingerprints:
+                logger.info(f"ログ (\"{logfile_path}\") は他のログと同じ内容のため解析しません.")
+                continue
+            fingerprints.add(fingerprint)
+            if index_dir is not None and is_reset:
+                ParserStateIndex(index_dir / f"{logfile_path.name}.index").reset()
+            elif index_dir is not None and old_name is not None and old_name != logfile_path.name:
+                # 名前の変わったログは索引も引き継ぐ
+                old_index_path = index_dir / f"{old_name}.index"
+                if old_index_path.exists():
+                    old_index_path.replace(index_dir / f"{logfile_path.name}.index")
+            status = status or entity.LogParserStatus(0, 0, None, None, None, None)
+            status.fingerprint = fingerprint
+            value[logfile_path.name] = status
+        return value
+
+    def backfill(self, log_dir: Path, since: datetime.datetime = None, until: datetime.datetime = None,
+                 retention: datetime.timedelta = None, max_workers: int = 8, max_capacity: float = 0.0):
+        # 過去のログを一括で転送 (通常の解析とは別に進捗を記録し、中断しても続きから再開する)
+        # (期間を指定した場合は、開始前日から終了までに作成されたログを対象とする)
+        logger.info(f"ログの一括転送を開始 (\"{log_dir}\", {since} - {until})")
+        stats.pop()
+        checkpoint = CheckpointStore(self._app_put_dir / "checkpoint", f"{self._profile}.backfill")
+        status = self.match_status(log_dir, checkpoint.load(), self._index_dir)
+        status = {
+            name: val for name, val in status.items()
+            if is_logfile_in_range(name, since - datetime.timedelta(days=1) if since is not None else None, until)
+        }
+        logfile_sizes = {name: (log_dir / name).stat().st_size for name in status.keys()}
+        total_size = max(1, sum(logfile_sizes.values()))
+
+        def get_progress_size() -> int:
+            # 圧縮済みのログは読み終えた時点で計上
+            return sum(
+                min(val.pos, logfile_sizes[name]) if not is_archive(log_dir / name)
+                else logfile_sizes[name] if VRChatLogReader.is_read_all(log_dir / name, val.pos) else 0
+                for name, val in status.items())
+
+        vrc = VRChatResource(log_dir, 0, self._index_dir)
+        writer = AdaptiveBatchWriter(self._dynamo, max_workers, max_capacity, retention, self.UPLOAD_BATCH_LEN)
+        time_start = datetime.datetime.now()
+        old_time = time_start
+        progress_size_start = get_progress_size()
+        count = 0
+        activities = list()
         try:
-            cp_obj = cp_filepath.read_text(encoding="utf8")
-            cp_obj = json.loads(cp_obj, object_hook=App.json_dec)
-            return cp_obj
-        except FileNotFoundError as ex:
-            return dict()
+            for activity in vrc.read_log(self._account_name, status):
+                if since is not None and activity.timestamp < since:
+                    continue
+                if until is not None and activity.timestamp >= until:
+                    continue
+                count += 1
+
+                # 次のログを読込む前に書込むため、この時点の進捗は転送済みのログと一致する
+                activities.append(activity)
+                if len(activities) < writer.round_len:
+                    continue
+                writer.write(activities)
+                activities = list()
+
+                newTime = datetime.datetime.now()
+                if newTime - old_time > self.PROGRESS_INTERVAL:
+                    checkpoint.save(status)
+                    old_time = newTime
+
+                    # 進捗と残り時間を表示
+                    progress_size = get_progress_size()
+                    elapsed = (newTime - time_start).total_seconds()
+                    rate = (progress_size - progress_size_start) / elapsed if elapsed > 0 else 0.0
+                    eta = datetime.timedelta(seconds=int((total_size - progress_size) / rate)) if rate > 0 else "不明"
+                    print(
+                        f"{newTime:%Y-%m-%d %H:%M:%S} ... 一括転送中 {progress_size / total_size * 100:5.1f}% "
+                        f"({count} 件, {count / elapsed:.0f} 件/s, 並行数 {writer.concurrency}, "
+                        f"{writer.consumed_capacity / elapsed:.1f} WCU/s, 残り {eta})")
+
+            writer.write(activities)
+            checkpoint.save(status)
+        finally:
+            writer.close()
+        print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} ... ログを一括転送 ({count} 件, {writer.consumed_capacity:.0f} WCU)")
+        logger.info(f"ログの一括転送を完了 ({count} 件)")
+        self.report_stats()
+
+    def reparse(self, logfile_name: str, pos: int = None, timestamp: datetime.datetime = None):
+        # 索引に記録した最寄りの状態から解析し直し、指定位置 (時刻) 以降のアクティビティを再転送
+        # (再転送は同一キーへの上書きとなる。進捗の記録は変更しない)
+        logfile_path = self._logdir / logfile_name
+        status = ParserStateIndex(self._index_dir / f"{logfile_name}.index").find(pos, timestamp)
+        logger.info(f"ログ (\"{logfile_path}\") の再解析を開始 (Pos: {status.pos})")
+        stats.pop()
+
+        count = 0
+        self.open_uploader()
+        try:
+            reader = VRChatLogReader(logfile_path, True, self._account_name, status)
+            for activity in reader.read():
+                if pos is not None and reader._status.pos <= pos:
+                    continue
+                if timestamp is not None and activity.timestamp < timestamp:
+                    continue
+                count += 1
+                self._activities.append(activity)
+                if len(self._activities) >= self.UPLOAD_BATCH_LEN:
+                    self.flush_activities()
+            self.flush_activities()
+            self.wait_uploader()
+        finally:
+            self.close_uploader()
+        print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} ... ログを再アップロード ({count} 件)")
+        logger.info(f"ログ (\"{logfile_path}\") の再解析を完了 ({count} 件)")
+        self.report_stats()
+
+    def watch(self, watcher: VRChatLogWatcher):
+        # 既存のログを処理した後、最新のログを追跡して書き込まれた分を随時転送
+        self.invoke()
+        self._watch_count = 0
+        self._watch_moveworld = False
+        self.open_uploader()
+        try:
+            self.watch_logs(watcher)
+        finally:
+            self.close_uploader()
+
+    def watch_logs(self, watcher: VRChatLogWatcher):
+        while True:
+            logfile_path = find_latest_logfile(self._logdir)
+            if logfile_path is None:
+                watcher.wait(self._check_interval_sec)
+                continue
+
+            logger.info(f"ログ (\"{logfile_path}\") の追跡を開始")
+            status = self._status.setdefault(logfile_path.name, entity.LogParserStatus(0, 0, None, None, None, None))
+            follower = VRChatLogFollower(logfile_path, watcher, self.WATCH_IDLE_SEC, self.flush_watch, self._check_interval_sec)
+            index = ParserStateIndex(self._index_dir / f"{logfile_path.name}.index")
+            reader = VRChatLogReader(logfile_path, True, self._account_name, status, follower, index)
+            for activity in reader.read():
+                self._watch_count += 1
+                self._watch_moveworld |= activity.type == entity.LogEventType.ENTER_WORLD or activity.type == entity.LogEventType.LEFT_WORLD
+                self._activities.append(activity)
+                if len(self._activities) >= self.UPLOAD_BATCH_LEN:
+                    self.flush_activities()
+            self.flush_watch()
+
+            # 解析対象外のログ (別ユーザ等) は次のログが作成されるまで待機
+            while not follower.is_rotated():
+                while not watcher.wait(self._check_interval_sec):
+                    pass
+
+    def flush_watch(self):
+        # 追跡中に書き込みが途切れた時点で進捗を記録
+        if self._watch_count == 0:
+            return
+        self.flush_activities()
+        self._checkpoint.save(self._status)
+        is_drained = self.wait_uploader()
+        print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} ... ログをアップロード ({self._watch_count} 件)")
+        self.enqueue_worker(self._watch_moveworld, is_drained)
+        logger.info(f"追跡中のログを転送 ({self._watch_count} 件)")
+        self._watch_count = 0
+        self._watch_moveworld = False
+        self.report_stats()
+
+    def report_stats(self):
+        # 処理段階毎の集計結果をログへ出力し、次の実行 (追跡中は次の転送) に向けて初期化
+        stats.log()
+        if self._stats_path is not None:
+            stats.dump(self._stats_path)
+        stats.pop()
+
+    def flush_activities(self):
+        # 溜めたアクティビティを送信箱へ書込み
+        if len(self._activities) == 0:
+            return
+        self._uploader.put(self._activities)
+        self._activities = list()
+
+    def open_uploader(self):
+        # 前回までに転送できなかった分も含めて送信箱の転送を開始
+        self._outbox = ActivityOutbox(self._outbox_path)
+        self._uploader = ActivityUploader(self._dynamo, self._outbox, self._upload_workers, self.UPLOAD_BATCH_LEN)
+
+    def wait_uploader(self) -> bool:
+        # 一定時間内に転送できなかった分は送信箱に残し、後で転送 (送信箱が空になれば True)
+        if self._uploader.wait(self.UPLOAD_WAIT_SEC):
+            return True
+        remain_count = self._outbox.count()
+        print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} ... 未転送のログを送信箱に保持 ({remain_count} 件)")
+        logger.warning(f"未転送のログを送信箱に保持 ({remain_count} 件)")
+        return False
+
+    def enqueue_worker(self, is_moveworld: bool, is_drained: bool):
+        # Worker は転送済みのアクティビティを参照するため、送信箱が空になってからキューイング
+        # (未転送分が残る場合は保留を記録し、以降の実行で送信箱が空になった時点でキューイング)
+        is_pending = self._enqueue_path.exists() or (is_moveworld and self._is_enabled_ewq)
+        if not is_pending:
+            return
+        if not is_drained:
+            self._enqueue_path.parent.mkdir(parents=True, exist_ok=True)
+            self._enqueue_path.touch()
+            return
+
+        print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} ... Worker へキューイング")
+        logger.info(f"Worker ({self._put_queue_name}) へキューイング")
+        srv = sqs.WorkerService(self._account_id, self._put_queue_name, self._aws_sess, logger)
+        srv.enqueue()
+        self._enqueue_path.unlink(missing_ok=True)
+
+    def close_uploader(self):
+        self._uploader.close()
+        self._outbox.close()
+        self._uploader = None
+        self._outbox = None
 
     @staticmethod
-    def set_status(app_dir: Path, profile: str, value: dict[str, entity.LogParserStatus]) -> None:
-        cp_filepath = app_dir / f"checkpoint/{profile}.json"
-        cp_filepath = cp_filepath.resolve()
-        cp_text = json.dumps(value, ensure_ascii=False, indent=2, default=App.json_enc)
-        cp_filepath.write_text(cp_text, encoding="utf8")
+    def get_status(app_dir: Path, profile: str) -> dict[str, entity.LogParserStatus]:
+        return CheckpointStore(app_dir / "checkpoint", profile).load()
 
     @staticmethod
-    def json_dec(o):
-        if "_type" not in o:
-            return o
+    def set_status(app_dir: Path, profile: str, value: dict[str, entity.LogParserStatus]) -> None:
+        CheckpointStore(app_dir / "checkpoint", profile).compact(value)
 
-        typ = o["_type"]
-        if typ == "LogParserStatus":
-            return entity.LogParserStatus(
-                o["Pos"],
-                o["VisitedWorldCount"],
-                o["AuthUserDisplayName"],
-                o["CurrentWorldId"],
-                o["CurrentWorldName"],
-                o["CurrentInstanceId"]
-            )
 
-    @staticmethod
-    def json_enc(o):
-        if isinstance(o, entity.LogParserStatus):
-            return {
-                "_type": "LogParserStatus",
-                "Pos": o.pos,
-                "VisitedWorldCount": o.visited_world_count,
-                "AuthUserDisplayName": o.authuser_display_name,
-                "CurrentWorldId": o.current_world_id,
-                "CurrentWorldName": o.current_world_name,
-                "CurrentInstanceId": o.current_instance_id
-            }
-        else:
-            return super().default(o)
+def is_logfile_in_range(logfile_name: str, since: datetime.datetime, until: datetime.datetime) -> bool:
+    # ファイル名の作成日時で判定 (日時を含まない名前は常に対象とする)
+    match_res = re.match(r"output_log_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})", logfile_name)
+    if match_res is None:
+        return True
+    created = datetime.datetime.strptime(match_res.group(1), "%Y-%m-%d_%H-%M-%S")
+    return (since is None or since <= created) and (until is None or created < until)
+
+
+def parse_datetime(text: str, is_until: bool = False) -> datetime.datetime:
+    # 日付のみの場合、終了日時はその日の終わりとする
+    try:
+        return datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        value = datetime.datetime.strptime(text, "%Y-%m-%d")
+        return value + datetime.timedelta(days=1) if is_until else value
+
+
+def find_logfiles(log_dir: Path) -> list[Path]:
+    # 圧縮済みのログ (gzip, zstd) も対象とする
+    logfiles = [f for pattern in LOG_FILE_PATTERNS for f in log_dir.glob(pattern) if f.is_file()]
+    return sorted(logfiles)
+
+
+def is_archive(logfile_path: Path) -> bool:
+    return logfile_path.suffix in (".gz", ".zst")
+
+
+def open_logfile(logfile_path: Path):
+    # 圧縮済みのログは展開しながら読み込むストリームとして開く
+    if logfile_path.suffix == ".gz":
+        return gzip.open(logfile_path, mode="rb")
+    elif logfile_path.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(f"zstd で圧縮されたログを読込むには zstandard が必要です ({logfile_path})")
+        return zstandard.ZstdDecompressor().stream_reader(logfile_path.open(mode="rb"), read_across_frames=True, closefd=True)
+    return logfile_path.open(mode="rb")
+
+
+def read_log_head(logfile_path: Path, size: int = 4096) -> bytes:
+    # 圧縮済みのログは展開後の内容 (圧縮前のログと同じ識別子となる)
+    with open_logfile(logfile_path) as log_stream:
+        return log_stream.read(size)
+
+
+def get_fingerprint(log_head: bytes) -> str:
+    # 先頭部分のバイト数とハッシュ値 (先頭部分にはログの開始時刻が含まれるため、ログ毎に異なる)
+    return f"{len(log_head)}:{hashlib.sha256(log_head).hexdigest()[:32]}"
+
+
+def is_same_logfile(log_head: bytes, fingerprint: str) -> bool:
+    # 記録時のファイルが小さかった場合は、その時点の長さで比較する
+    if fingerprint is None:
+        return True
+    size = int(fingerprint.split(":", 1)[0])
+    return len(log_head) >= size and get_fingerprint(log_head[:size]) == fingerprint
+
+
+def find_latest_logfile(log_dir: Path) -> Path:
+    logfiles = [(f, f.stat().st_mtime) for f in log_dir.glob("output_log_*.txt") if f.is_file()]
+    if len(logfiles) == 0:
+        return None
+    return max(logfiles, key=lambda val: (val[1], val[0].name))[0]
+
+
+def init_worker(log_queue) -> None:
+    # プロセスプールのワーカは、ログを呼び出し元へ送って出力する
+    # (fork で引き継いだハンドラも外し、同じログファイルを複数のプロセスで書き込まない)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+
+
+def read_logfile(logfile_path: Path, is_read_lastlog: bool, target_user: str, status: entity.LogParserStatus, index=None) -> Tuple[list, entity.LogParserStatus, dict]:
+    # プロセスプールから呼び出すため、モジュールの関数として定義
+    # (集計結果はプロセス毎に保持されるため、取り出して呼び出し元へ返す)
+    # (fork したワーカは呼び出し元の集計結果を引き継ぐため、解析前に破棄して二重に集計しない)
+    stats.pop()
+    reader = VRChatLogReader(logfile_path, is_read_lastlog, target_user, status, index=index)
+    log_items = list(reader.read())
+    return log_items, reader._status, stats.pop()
 
 
 def get_stacktrace() -> str:
@@ -443,20 +1704,49 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("-p", "--profile", default="default", required=False)
     parser.add_argument("--watch", action="store_true")
+    parser.add_argument("--reparse", default=None, metavar="LOGFILE", help="指定したログを索引から解析し直す")
+    parser.add_argument("--since", default=None, help="再解析・一括転送の開始日時 (例: \"2012-01-23 01:23:45\", \"2012-01-23\")")
+    parser.add_argument("--since-pos", type=int, default=None, help="再解析の開始位置 (バイト数)")
+    parser.add_argument("--backfill", nargs="?", const="", default=None, metavar="LOG_DIR", help="過去のログを一括転送 (省略時は設定のログディレクトリ)")
+    parser.add_argument("--until", default=None, help="一括転送の終了日時 (例: \"2012-01-31\")")
+    parser.add_argument("--retention-days", type=float, default=1.0, help="一括転送したアクティビティの保持日数 (0 の場合は無期限)")
+    parser.add_argument("--max-workers", type=int, default=8, help="一括転送の最大並行数")
+    parser.add_argument("--max-wcu", type=float, default=0.0, help="一括転送で消費する書込みキャパシティの上限 (WCU/s, 0 の場合は無制限)")
+    parser.add_argument("--stats", type=Path, default=None, metavar="FILE", help="処理段階毎の集計結果を JSON で出力")
+    parser.add_argument("--cprofile", type=Path, default=None, metavar="FILE", help="cProfile で計測し、結果を出力 (-p は設定のプロファイル名)")
     args = parser.parse_args()
     arg_watch = args.watch
     arg_profile = args.profile
 
     app = App(app_dir, app_dir, arg_profile)
-    vrc = VRChatResource(app.log_dir)
+    vrc = VRChatResource(app.log_dir, app.parse_workers, app.index_dir)
     dyn = dynamodb.Service(app.account_id, app.get_table_name, app.put_table_name, app.aws_sess, logger)
-    app.init(vrc, dyn)
+    app.init(vrc, dyn, args.stats)
 
-    if arg_watch == False:
-        app.invoke()
-    else:
-        schedule.every(app.check_interval_sec).seconds.do(app.invoke)
-        schedule.run_all()
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+    profiler = cProfile.Profile() if args.cprofile is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        if args.backfill is not None:
+            since = parse_datetime(args.since) if args.since is not None else None
+            until = parse_datetime(args.until, True) if args.until is not None else None
+            retention = datetime.timedelta(days=args.retention_days) if args.retention_days > 0 else None
+            app.backfill(Path(args.backfill or app.log_dir), since, until, retention, args.max_workers, args.max_wcu)
+        elif args.reparse is not None:
+            since = parse_datetime(args.since) if args.since is not None else None
+            app.reparse(args.reparse, args.since_pos, since)
+        elif arg_watch == False:
+            app.invoke()
+        else:
+            watcher = VRChatLogWatcher(app.log_dir)
+            try:
+                app.watch(watcher)
+            finally:
+                watcher.close()
+    finally:
+        # 中断した場合も計測結果を出力 (追跡中は Ctrl+C で終了)
+        if profiler is not None:
+            profiler.disable()
+            args.cprofile.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(args.cprofile)
+            pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(30)
@@ -0,0 +1,139 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+# 生成したログに対するパーサのスループットを計測し、ベースラインと比較する
+# (例) poetry run python tests/benchmark.py --size 64MB --save
+app_dir = Path(__file__).parent.parent.resolve()
+sys.path.append(str(app_dir / "src"))
+sys.path.append(str(app_dir / "tests"))
+
+import loggen
+import main
+
+
+def measure_reader(log_path: Path, auth_user: str, repeat: int) -> dict[str, float]:
+    # VRChatLogReader.read (1ファイル)
+    best = None
+    for _ in range(repeat):
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        reader = main.VRChatLogReader(log_path, True, auth_user, status)
+        time_start = time.perf_counter()
+        count = sum(1 for _ in reader.read())
+        elapsed = time.perf_counter() - time_start
+        best = elapsed if best is None else min(best, elapsed)
+    return to_result(log_path.stat().st_size, count, best)
+
+
+def measure_resource(log_dir: Path, auth_user: str, workers: int, repeat: int) -> dict[str, float]:
+    # VRChatResource.read_log (ディレクトリ内の全ファイル)
+    best = None
+    size = sum(path.stat().st_size for path in log_dir.glob("output_log_*.txt"))
+    for _ in range(repeat):
+        configs = {path.name: main.entity.LogParserStatus(0, 0, None, None, None, None) for path in log_dir.glob("output_log_*.txt")}
+        resource = main.VRChatResource(log_dir, workers)
+        time_start = time.perf_counter()
+        count = sum(1 for _ in resource.read_log(auth_user, configs))
+        elapsed = time.perf_counter() - time_start
+        best = elapsed if best is None else min(best, elapsed)
+    return to_result(size, count, best)
+
+
+def to_result(size: int, count: int, elapsed: float) -> dict[str, float]:
+    return {
+        "mb_per_sec": size / 1_048_576 / elapsed,
+        "events_per_sec": count / elapsed,
+        "size": size,
+        "events": count,
+        "elapsed": elapsed
+    }
+
+
+def run(log_dir: Path, config: loggen.LogGenConfig, file_count: int, workers: int, repeat: int) -> dict[str, dict[str, float]]:
+    results = loggen.generate_logs(log_dir, file_count, config)
+    print(f"ログを生成 ({file_count} files, {sum(res.size for res in results) / 1_048_576:.1f} MB)")
+
+    log_paths = sorted(log_dir.glob("output_log_*.txt"))
+    cases = dict()
+    cases["reader"] = measure_reader(log_paths[0], config.auth_user, repeat)
+    cases["resource.workers_1"] = measure_resource(log_dir, config.auth_user, 1, repeat)
+    if workers > 1:
+        cases[f"resource.workers_{workers}"] = measure_resource(log_dir, config.auth_user, workers, repeat)
+    return cases
+
+
+def get_revision() -> str:
+    try:
+        res = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=app_dir, capture_output=True, text=True, check=True)
+        return res.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_baselines(baseline_path: Path) -> list[dict]:
+    try:
+        return json.loads(baseline_path.read_text(encoding="utf8"))
+    except FileNotFoundError:
+        return list()
+
+
+def compare(cases: dict, baseline: dict, tolerance: float) -> bool:
+    # ベースラインより一定以上遅い計測項目があれば退行とみなす
+    is_ok = True
+    print(f"ベースライン: {baseline['revision']} ({baseline['date']})")
+    for name, res in cases.items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            print(f"  {name:<24} (ベースライン無し)")
+            continue
+        ratio = res["mb_per_sec"] / base["mb_per_sec"]
+        mark = "" if ratio >= 1.0 - tolerance else "  << 退行"
+        is_ok &= mark == ""
+        print(f"  {name:<24} {base['mb_per_sec']:8.1f} -> {res['mb_per_sec']:8.1f} MB/s ({ratio:.2f}x){mark}")
+    return is_ok
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="ログ解析のスループットを計測")
+    parser.add_argument("--size", default="32MB", help="1ファイルあたりのサイズ (例: 512KB, 100MB, 2GB)")
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--log-dir", type=Path, default=None, help="生成したログの出力先 (省略時は一時ディレクトリ)")
+    parser.add_argument("--baseline", type=Path, default=app_dir / "tests/sandbox/benchmark_baseline.json")
+    parser.add_argument("--compare", default=None, help="比較するベースラインのリビジョン (省略時は最新)")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--save", action="store_true", help="計測結果をベースラインとして保存")
+    args = parser.parse_args()
+
+    config = loggen.LogGenConfig(size=loggen.parse_size(args.size), seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_dir = args.log_dir or Path(tmp_dir)
+        cases = run(log_dir, config, args.files, args.workers, args.repeat)
+
+    for name, res in cases.items():
+        print(f"{name:<24} {res['mb_per_sec']:8.1f} MB/s {res['events_per_sec']:10.0f} events/s ({res['elapsed']:.2f} s)")
+
+    baselines = load_baselines(args.baseline)
+    candidates = [item for item in baselines if args.compare is None or item["revision"] == args.compare]
+    is_ok = compare(cases, candidates[-1], args.tolerance) if len(candidates) > 0 else True
+
+    if args.save:
+        baselines.append({
+            "revision": get_revision(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "params": {"size": config.size, "files": args.files, "seed": args.seed},
+            "cases": cases
+        })
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baselines, ensure_ascii=False, indent=2), encoding="utf8")
+        print(f"ベースラインを保存 ({args.baseline})")
+
+    sys.exit(0 if is_ok else 1)
@@ -0,0 +1,184 @@
+import dataclasses
+import datetime
+import random
+import re
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# VRChat のログ (output_log_*.txt) を模したファイルを生成する
+# 乱数のシードを固定すれば同じ内容のファイルが生成される
+
+
+@dataclass
+class LogGenConfig:
+    size: int = 8 * 1_048_576
+    seed: int = 0
+    auth_user: str = "認証ユーザ"
+    behaviour_ratio: float = 0.15
+    multiline_ratio: float = 0.02
+    multiline_lines: int = 40
+    japanese_ratio: float = 0.5
+    players_max: int = 40
+    newline: str = "\r\n"
+    start_time: datetime.datetime = datetime.datetime(2012, 1, 23, 1, 23, 45)
+
+
+@dataclass
+class LogGenResult:
+    size: int = 0
+    records: int = 0
+    events: int = 0
+    event_counts: dict[str, int] = field(default_factory=dict)
+
+
+class LogGenerator:
+    NAMES_JA = ["ねこ", "いぬ", "うさぎ", "きつね", "たぬき", "くま", "しか", "りす", "ふくろう", "ぺんぎん"]
+    NAMES_SUFFIX_JA = ["さん", "ちゃん", "くん", "様", "", "★", "（休憩中）"]
+    NAMES_EN = ["Alice", "Bob", "Carol", "Dave", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy"]
+    WORLDS = ["ワールド名", "Japan Street", "The Great Pug", "夜の水族館", "Movie & Chill", "Sample World #2"]
+    NOISES = [
+        "Log        -  [Network Processing] RPC SendRPC (Target: AllBufferOne)",
+        "Log        -  [Always] uSpeak: SetInputDevice 0 (2 total) 'Microphone (Sample Audio Device)'",
+        "Warning    -  OvrLipSync Awake: Queried SampleRate: 48000 BufferSize: 1024",
+        "Log        -  [AssetBundleDownloadManager] Unpacking asset bundle (Sample Avatar)",
+        "Log        -  [Behaviour] Switching {name} to avatar サンプルアバター",
+        "Log        -  [Behaviour] Destroying {name}",
+        "Log        -  [Video Playback] Resolving URL 'https://example.com/video'",
+        "Log        -  [API] Requesting Get analysis/file_xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx/1/standalonewindows",
+    ]
+
+    def __init__(self, config: LogGenConfig):
+        self._config = config
+        self._random = random.Random(config.seed)
+        self._time = config.start_time
+        self._result = LogGenResult()
+
+    def generate(self, path: Path) -> LogGenResult:
+        with path.open(mode="w", encoding="utf8", newline="") as f:
+            for record in self.records():
+                f.write(record)
+        return self._result
+
+    def records(self):
+        conf = self._config
+        self._result = LogGenResult()
+        yield self._record("Log        -  [Behaviour] User Authenticated: " + conf.auth_user, [
+            "- hasEmail: True", "- hasBirthday: True", "- tos: 7",
+            "- avatar: avtr_xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
+        ])
+        while self._result.size < conf.size:
+            yield from self._session()
+
+    def _session(self):
+        # ワールドへの入室から退室まで
+        conf = self._config
+        rnd = self._random
+        world_no = rnd.randrange(0xffffffff)
+        yield self._record(f"Log        -  [Behaviour] Entering Room: {rnd.choice(self.WORLDS)}")
+        yield self._event("JOIN_INSTANCE", f"Log        -  [Behaviour] Joining wrld_{world_no:08x}-xxxx-xxxx-xxxx-xxxxxxxxxxxx:{rnd.randrange(100000)}~region(jp)")
+        yield self._event("INITIALIZE_API", f"Log        -  [Behaviour] Initialized PlayerAPI \"{conf.auth_user}\" is local")
+
+        players = set()
+        for _ in range(rnd.randrange(50, 400)):
+            if self._result.size >= conf.size:
+                break
+            if rnd.random() >= conf.behaviour_ratio:
+                yield from self._noise()
+            elif len(players) == 0 or (len(players) < conf.players_max and rnd.random() < 0.55):
+                name = self._name()
+                players.add(name)
+                yield self._event("ENTER_PLAYER", f"Log        -  [Behaviour] OnPlayerJoined {name}")
+                if rnd.random() < 0.5:
+                    yield self._event("INITIALIZE_API", f"Log        -  [Behaviour] Initialized PlayerAPI \"{name}\" is remote")
+            else:
+                name = rnd.choice(sorted(players))
+                players.discard(name)
+                yield self._event("LEFT_PLAYER", f"Log        -  [Behaviour] OnPlayerLeft {name}")
+
+        for name in sorted(players):
+            yield self._event("LEFT_PLAYER", f"Log        -  [Behaviour] OnPlayerLeft {name}")
+        yield self._event("LEFT_WORLD", "Log        -  [Behaviour] OnLeftRoom")
+
+    def _noise(self):
+        conf = self._config
+        rnd = self._random
+        if rnd.random() < conf.multiline_ratio:
+            # 例外のスタックトレース等、複数行に渡るレコード
+            lines = [
+                f"  at VRC.Core.Sample.Method{i:03} () [0x{rnd.randrange(0x1000):05x}] in <00000000000000000000000000000000>:0 "
+                for i in range(rnd.randrange(conf.multiline_lines // 2, conf.multiline_lines * 2))
+            ]
+            yield self._record("Error      -  NullReferenceException: Object reference not set to an instance of an object.", lines)
+        else:
+            yield self._record(rnd.choice(self.NOISES).format(name=self._name()))
+
+    def _name(self) -> str:
+        rnd = self._random
+        if rnd.random() < self._config.japanese_ratio:
+            return rnd.choice(self.NAMES_JA) + rnd.choice(self.NAMES_SUFFIX_JA) + str(rnd.randrange(100))
+        return rnd.choice(self.NAMES_EN) + str(rnd.randrange(1000))
+
+    def _event(self, event_type: str, message: str) -> str:
+        self._result.events += 1
+        self._result.event_counts[event_type] = self._result.event_counts.get(event_type, 0) + 1
+        return self._record(message)
+
+    def _record(self, message: str, lines: list = ()) -> str:
+        # 時刻はレコード毎に確率的に進める (同じ秒のレコードが続くことが多い)
+        if self._random.random() < 0.3:
+            self._time += datetime.timedelta(seconds=self._random.randrange(1, 5))
+        newline = self._config.newline
+        record = f"{self._time:%Y.%m.%d %H:%M:%S} {message}{newline}"
+        record += "".join(f"{line}{newline}" for line in lines)
+        record += newline * 2
+        self._result.size += len(record.encode("utf8"))
+        self._result.records += 1
+        return record
+
+
+def generate_logs(log_dir: Path, file_count: int, config: LogGenConfig) -> list[LogGenResult]:
+    # 複数ファイルを生成する場合はシードと開始時刻をずらす
+    log_dir.mkdir(parents=True, exist_ok=True)
+    results = list()
+    for i in range(file_count):
+        conf = dataclasses.replace(config, seed=config.seed + i, start_time=config.start_time + datetime.timedelta(days=i))
+        path = log_dir / f"output_log_{conf.start_time:%Y-%m-%d_%H-%M-%S}.txt"
+        results.append(LogGenerator(conf).generate(path))
+    return results
+
+
+def parse_size(text: str) -> int:
+    match_res = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?)B?", text.strip().upper())
+    if match_res is None:
+        raise ValueError(f"サイズの形式が不正です ({text})")
+    unit = {"": 1, "K": 1024, "M": 1_048_576, "G": 1_073_741_824}[match_res.group(2)]
+    return int(float(match_res.group(1)) * unit)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="VRChat のログを模したファイルを生成")
+    parser.add_argument("log_dir", type=Path)
+    parser.add_argument("--size", default="8MB", help="1ファイルあたりのサイズ (例: 512KB, 100MB, 2GB)")
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--auth-user", default=LogGenConfig.auth_user)
+    parser.add_argument("--behaviour-ratio", type=float, default=LogGenConfig.behaviour_ratio)
+    parser.add_argument("--multiline-ratio", type=float, default=LogGenConfig.multiline_ratio)
+    parser.add_argument("--multiline-lines", type=int, default=LogGenConfig.multiline_lines)
+    parser.add_argument("--japanese-ratio", type=float, default=LogGenConfig.japanese_ratio)
+    parser.add_argument("--newline", choices=["crlf", "lf"], default="crlf")
+    args = parser.parse_args()
+
+    config = LogGenConfig(
+        size=parse_size(args.size),
+        seed=args.seed,
+        auth_user=args.auth_user,
+        behaviour_ratio=args.behaviour_ratio,
+        multiline_ratio=args.multiline_ratio,
+        multiline_lines=args.multiline_lines,
+        japanese_ratio=args.japanese_ratio,
+        newline="\r\n" if args.newline == "crlf" else "\n"
+    )
+    for res in generate_logs(args.log_dir, args.files, config):
+        print(f"{res.size / 1_048_576:.1f} MB, {res.records} records, {res.events} events {res.event_counts}")
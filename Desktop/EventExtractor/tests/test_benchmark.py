@@ -0,0 +1,187 @@
+import datetime
+import os
+import re
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.append("src")
+sys.path.append("tests")
+
+
+def write_exception_log(path: Path, record_count: int, dump_lines: int) -> int:
+    # 巨大な複数行の例外ダンプを含むログを生成
+    dump = "".join(f"  at VRC.Core.Sample.Method{i:05} () [0x00000] in <00000000000000000000000000000000>:0 \n" for i in range(dump_lines))
+    with path.open("w", encoding="utf8", newline="\n") as f:
+        for i in range(record_count):
+            f.write(f"2012.01.23 01:23:{i % 60:02} Error      -  NullReferenceException: Object reference not set to an instance of an object.\n")
+            f.write(dump)
+            f.write("\n\n")
+            f.write(f"2012.01.23 01:23:{i % 60:02} Log        -  [Behaviour] OnPlayerJoined ユーザ名{i}\n\n\n")
+    return record_count * 2
+
+
+class TestVRChatLogSegmenterThroughput:
+    def test_split_huge_records(self, tmp_path):
+        from src import main
+        log_path = tmp_path / "output_log_exception.txt"
+        record_count = write_exception_log(log_path, 20, 10_000)
+        log_buffer = log_path.read_bytes()
+
+        # バッファ全体 (mmap 相当)
+        time_start = time.perf_counter()
+        target = main.VRChatLogSegmenter()
+        res = list(target.split(log_buffer, len(log_buffer), True))
+        time_split = time.perf_counter() - time_start
+        assert len(res) == record_count
+        assert res[-1][1] == len(log_buffer)
+
+        # 小さなチャンク (巨大なレコードが多数のチャンクに跨る)
+        time_start = time.perf_counter()
+        target = main.VRChatLogSegmenter()
+        count = 0
+        for i in range(0, len(log_buffer), 4096):
+            count += sum(1 for _ in target.feed(log_buffer[i:i + 4096]))
+        count += sum(1 for _ in target.flush())
+        time_feed = time.perf_counter() - time_start
+        assert count == record_count
+
+        size_mb = len(log_buffer) / 1_048_576
+        print(f"split: {size_mb / time_split:.1f} MB/s, feed: {size_mb / time_feed:.1f} MB/s ({size_mb:.1f} MB)")
+        # 走査済みの範囲を再走査すると二乗オーダーとなり到底収まらない
+        assert time_feed < 10.0
+
+    def test_read_huge_records(self, tmp_path):
+        from src import main
+        log_path = tmp_path / "output_log_exception.txt"
+        record_count = write_exception_log(log_path, 20, 10_000)
+
+        time_start = time.perf_counter()
+        status = main.entity.LogParserStatus(0, 1, "認証ユーザ", "wrld_xxx", "ワールド名", "99999")
+        res = list(main.VRChatLogReader.read_file(log_path, True, "認証ユーザ", status))
+        time_read = time.perf_counter() - time_start
+        assert len(res) == record_count // 2
+        assert status.pos == log_path.stat().st_size
+
+        size_mb = status.pos / 1_048_576
+        print(f"read: {size_mb / time_read:.1f} MB/s ({size_mb:.1f} MB)")
+
+
+class LegacyParser:
+    # 比較用: 従来の正規表現を順に試す実装
+    REGEX_ENTER_WORLD_01 = re.compile(
+        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] Entering Room: (?P<WorldName>[^\n]+)")
+    REGEX_ENTER_WORLD_02 = re.compile(
+        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] Joining (?P<WorldId>(?:wrld_[^:]+)|(?:local)):(?P<InstanceId>[^\n]+)")
+    REGEX_PLAYER_JOINED = re.compile(
+        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] OnPlayerJoined (?P<UserName>[^\n]+)")
+    REGEX_INITIALIZED_API = re.compile(
+        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] Initialized PlayerAPI \"(?P<UserName>.*)\" is (?P<Mode>[^\n]+)")
+    REGEX_PLAYER_LEFT = re.compile(
+        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] OnPlayerLeft (?P<UserName>[^\n]+)")
+    REGEX_LEFT_WORLD = re.compile(
+        r"^(?P<Timestamp>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2})[^-]+-  \[Behaviour\] OnLeftRoom")
+
+    @staticmethod
+    def parse_activity(log_item: str, status):
+        from src import main
+        entity = main.entity
+        if log_item == "" or log_item[34:45] != "[Behaviour]":
+            return None
+        elif match_res := LegacyParser.REGEX_ENTER_WORLD_01.match(log_item):
+            timestamp = datetime.datetime.strptime(match_res.group("Timestamp"), "%Y.%m.%d %H:%M:%S")
+            return entity.LogEventEnterWorld(
+                entity.LogEventType.ENTER_WORLD, timestamp,
+                status.current_instance_id, status.current_world_id, match_res.group("WorldName"))
+        elif match_res := LegacyParser.REGEX_ENTER_WORLD_02.match(log_item):
+            timestamp = datetime.datetime.strptime(match_res.group("Timestamp"), "%Y.%m.%d %H:%M:%S")
+            return entity.LogEventEnterWorld(
+                entity.LogEventType.JOIN_INSTANCE, timestamp,
+                match_res.group("InstanceId"), match_res.group("WorldId"), status.current_world_name)
+        elif match_res := LegacyParser.REGEX_LEFT_WORLD.match(log_item):
+            timestamp = datetime.datetime.strptime(match_res.group("Timestamp"), "%Y.%m.%d %H:%M:%S")
+            return entity.LogEventLeftWorld(
+                entity.LogEventType.LEFT_WORLD, timestamp,
+                status.current_instance_id, status.current_world_id, status.current_world_name)
+        elif match_res := LegacyParser.REGEX_PLAYER_JOINED.match(log_item):
+            timestamp = datetime.datetime.strptime(match_res.group("Timestamp"), "%Y.%m.%d %H:%M:%S")
+            return entity.LogEventEnterPlayer(
+                entity.LogEventType.ENTER_PLAYER, timestamp,
+                status.current_instance_id, status.current_world_id, status.current_world_name, match_res.group("UserName"))
+        elif match_res := LegacyParser.REGEX_PLAYER_LEFT.match(log_item):
+            timestamp = datetime.datetime.strptime(match_res.group("Timestamp"), "%Y.%m.%d %H:%M:%S")
+            return entity.LogEventLeftPlayer(
+                entity.LogEventType.LEFT_PLAYER, timestamp,
+                status.current_instance_id, status.current_world_id, status.current_world_name, match_res.group("UserName"))
+        elif match_res := LegacyParser.REGEX_INITIALIZED_API.match(log_item):
+            timestamp = datetime.datetime.strptime(match_res.group("Timestamp"), "%Y.%m.%d %H:%M:%S")
+            return entity.LogEventInitializedApi(
+                entity.LogEventType.INITIALIZE_API, timestamp,
+                status.current_instance_id, status.current_world_id, status.current_world_name,
+                match_res.group("UserName"), match_res.group("Mode"))
+        else:
+            return None
+
+
+class TestParseActivityBenchmark:
+    LOG_ITEMS = {
+        "ENTER_WORLD": "2012.01.23 01:23:45 Log        -  [Behaviour] Entering Room: ワールド名",
+        "JOIN_INSTANCE": "2012.01.23 01:23:45 Log        -  [Behaviour] Joining wrld_ffffffff-ffff-ffff-ffff-ffffffffffff:99999~private(usr_ffffffff-ffff-ffff-ffff-ffffffffffff)~region(jp)",
+        "LEFT_WORLD": "2012.01.23 01:23:45 Log        -  [Behaviour] OnLeftRoom",
+        "ENTER_PLAYER": "2012.01.23 01:23:45 Log        -  [Behaviour] OnPlayerJoined ユーザ名",
+        "LEFT_PLAYER": "2012.01.23 01:23:45 Log        -  [Behaviour] OnPlayerLeft ユーザ名",
+        "INITIALIZE_API": "2012.01.23 01:23:45 Log        -  [Behaviour] Initialized PlayerAPI \"ユーザ名\" is local",
+        "UNKNOWN": "2012.01.23 01:23:45 Log        -  [Behaviour] Switching ユーザ名 to avatar アバター名",
+    }
+
+    def test_parse_activity(self):
+        from src import main
+        status = main.entity.LogParserStatus(0, 1, "認証ユーザ", "wrld_xxx", "ワールド名", "99999")
+        number = 5_000
+        for name, log_item in self.LOG_ITEMS.items():
+            # 従来の実装と同じ結果となる
+            assert main.VRChatLogReader.parse_activity(log_item, status) == LegacyParser.parse_activity(log_item, status)
+
+            time_legacy = timeit.timeit(lambda: LegacyParser.parse_activity(log_item, status), number=number)
+            time_current = timeit.timeit(lambda: main.VRChatLogReader.parse_activity(log_item, status), number=number)
+            print(f"{name:<16} cascade: {time_legacy / number * 1e6:6.2f} us, dispatch: {time_current / number * 1e6:6.2f} us ({time_legacy / time_current:.2f}x)")
+
+
+class TestLogGenerator:
+    def test_generate(self, tmp_path):
+        import loggen
+        from src import main
+        config = loggen.LogGenConfig(size=1_048_576, seed=1)
+        res = loggen.generate_logs(tmp_path / "a", 1, config)[0]
+        loggen.generate_logs(tmp_path / "b", 1, config)
+        log_path = next((tmp_path / "a").iterdir())
+
+        # 同じシードからは同じ内容が生成される
+        assert log_path.read_bytes() == next((tmp_path / "b").iterdir()).read_bytes()
+        assert res.size == log_path.stat().st_size
+
+        # 生成したイベントが全て解析される
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        logs = list(main.VRChatLogReader(log_path, True, config.auth_user, status).read())
+        assert len(logs) == res.events
+        for event_type, count in res.event_counts.items():
+            assert sum(1 for log in logs if log.type.name == event_type) == count
+
+
+class TestVRChatResourceBenchmark:
+    def test_read_log_parallel(self, tmp_path):
+        import benchmark
+        import loggen
+        file_count = 4
+        config = loggen.LogGenConfig(size=2 * 1_048_576)
+        loggen.generate_logs(tmp_path, file_count, config)
+
+        # ワーカー数ごとの処理時間を計測 (結果は逐次処理と一致する)
+        expected = None
+        for workers in sorted({1, 2, min(file_count, os.cpu_count() or 1)}):
+            res = benchmark.measure_resource(tmp_path, config.auth_user, workers, 1)
+            if expected is None:
+                expected = res["events"]
+            assert res["events"] == expected
+            print(f"workers: {workers}, {res['mb_per_sec']:.1f} MB/s, {res['events_per_sec']:.0f} events/s ({res['size'] / 1_048_576:.1f} MB)")
@@ -5,6 +5,8 @@ import logging
 import sys
 import os
 import shutil
+import threading
+import time
 import pytest
 from pathlib import Path
 
@@ -28,6 +30,67 @@ class TestVRChatResource:
         assert len(logs) > 0
 
 
+    def test_readLog_parallel(self):
+        from src import main
+        log_dir = Path("tests/data/log")
+        files = ["output_log_sample01.txt", "output_log_sample02.txt", "output_log_sample03.txt"]
+
+        # 逐次に解析した場合と同じ順序・ステータスとなる
+        configs_seq = {file: main.entity.LogParserStatus(0, 0, None, None, None, None) for file in files}
+        logs_seq = list(main.VRChatResource(log_dir).read_log("認証ユーザ1", configs_seq))
+        configs_par = {file: main.entity.LogParserStatus(0, 0, None, None, None, None) for file in files}
+        logs_par = list(main.VRChatResource(log_dir, 2).read_log("認証ユーザ1", configs_par))
+        assert logs_par == logs_seq
+        assert configs_par == configs_seq
+
+    def test_readLog_parallel_logging(self):
+        import logging
+        from src import main
+        log_dir = Path("tests/data/log")
+        files = ["output_log_sample01.txt", "output_log_sample02.txt", "output_log_sample03.txt"]
+
+        # ワーカのログは呼び出し元のハンドラから出力される
+        records = list()
+        handler = logging.Handler()
+        handler.emit = records.append
+        main.logger.addHandler(handler)
+        try:
+            configs = {file: main.entity.LogParserStatus(0, 0, None, None, None, None) for file in files}
+            list(main.VRChatResource(log_dir, 2).read_log("認証ユーザ1", configs))
+        finally:
+            main.logger.removeHandler(handler)
+        assert any(record.processName != "MainProcess" and "解析を開始" in record.getMessage() for record in records)
+
+class TestVRChatLogSegmenter:
+    def test_split(self):
+        from src import main
+        log_buffer = Path("tests/data/log/output_log_sample01.txt").read_bytes()
+        target = main.VRChatLogSegmenter()
+        res = list(target.split(log_buffer, len(log_buffer), True))
+        assert len(res) == 8
+        assert res[0][0] == 0 and res[-1][1] == len(log_buffer)
+        assert all(prev[1] == curr[0] for prev, curr in zip(res, res[1:]))
+        assert log_buffer[res[1][0]:res[1][1]].decode("utf8").count("\n") == 8
+
+        # 途中から (最後のレコードは確定しない)
+        target = main.VRChatLogSegmenter(res[2][0])
+        assert list(target.split(log_buffer, len(log_buffer), False)) == res[2:-1]
+
+    def test_feed(self):
+        from src import main
+        log_buffer = Path("tests/data/log/output_log_sample01.txt").read_bytes()
+        expected = [log_buffer[start:end] for start, end in main.VRChatLogSegmenter().split(log_buffer, len(log_buffer), True)]
+
+        # チャンクの境界に依らず同じレコードに分割される
+        for chunk_size in [1, 7, 64, 4096]:
+            target = main.VRChatLogSegmenter()
+            res = list()
+            for i in range(0, len(log_buffer), chunk_size):
+                res.extend(bytes(target.buffer[start:end]) for start, end in target.feed(log_buffer[i:i + chunk_size]))
+            res.extend(bytes(target.buffer[start:end]) for start, end in target.flush())
+            assert res == expected
+
+
 class TestVRChatLogReader:
     def test_read(self):
         from src import main
@@ -65,14 +128,168 @@ class TestVRChatLogReader:
         obj = list(reader.read())
         assert len(obj) == 3
 
+    def test_read_prescan(self):
+        from src import main
+        log_path = Path("tests/data/log/output_log_sample01.txt")
+        assert main.VRChatLogReader.prescan_authuser(log_path) == "認証ユーザ1"
+
+        # 非対象ユーザのログは解析せずに読み飛ばす
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        assert list(main.VRChatLogReader(log_path, True, "認証ユーザ2", status).read()) == []
+        assert status.pos == 0
+
+    def test_read_prescan_authenticated(self, tmp_path, monkeypatch):
+        from src import main
+        log_path = Path("tests/data/log/output_log_sample01.txt")
+        log_text = log_path.read_bytes()
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        expected = list(main.VRChatLogReader(log_path, True, "認証ユーザ1", status).read())
+
+        # PlayerAPI の初期化が先頭部分に無い場合は、認証ユーザが対象ユーザと完全に一致する場合のみ確定する
+        monkeypatch.setattr(main.VRChatLogReader, "LOG_PRESCAN_SIZE", log_text.index(b"Initialized PlayerAPI"))
+        assert main.VRChatLogReader.prescan_authuser(log_path, "認証ユーザ1") == "認証ユーザ1"
+        assert main.VRChatLogReader.prescan_authuser(log_path, "認証ユーザ") is None
+        assert main.VRChatLogReader.prescan_authuser(log_path) is None
+
+        # 認証ユーザが表示名と異なっても読み飛ばさない
+        other_path = tmp_path / "output_log_01.txt"
+        other_path.write_bytes(log_text.replace("User Authenticated: 認証ユーザ1".encode(), b"User Authenticated: login_name"))
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        assert list(main.VRChatLogReader(other_path, True, "認証ユーザ1", status).read()) == expected
+
+    def test_read_spill(self, monkeypatch):
+        from src import main
+        monkeypatch.setattr(main.VRChatLogReader, "LOG_PRESCAN_SIZE", 0)
+        log_path = Path("tests/data/log/output_log_sample01.txt")
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        expected = list(main.VRChatLogReader(log_path, True, "認証ユーザ1", status).read())
+
+        # ログインユーザの特定を待つイベントが一時ファイルへ書き出されても同じ結果となる
+        status_spill = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        reader = main.VRChatLogReader(log_path, True, "認証ユーザ1", status_spill)
+        reader._log_buff = main.EventSpillBuffer(0)
+        assert list(reader.read()) == expected
+        assert status_spill == status
+        assert len(reader._log_buff) == 0
+
+    def test_read_archive(self, tmp_path):
+        import gzip
+        from src import main
+        log_path = Path("tests/data/log/output_log_sample01.txt")
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        expected = list(main.VRChatLogReader(log_path, True, "認証ユーザ1", status).read())
+
+        archive_paths = [tmp_path / "output_log_sample01.txt.gz"]
+        archive_paths[0].write_bytes(gzip.compress(log_path.read_bytes()))
+        try:
+            import zstandard
+            archive_paths.append(tmp_path / "output_log_sample01.txt.zst")
+            archive_paths[1].write_bytes(zstandard.ZstdCompressor().compress(log_path.read_bytes()))
+        except ImportError:
+            pass
+
+        for archive_path in archive_paths:
+            # 展開しながら解析し、位置は展開後のバイト数となる
+            status_archive = main.entity.LogParserStatus(0, 0, None, None, None, None)
+            reader = main.VRChatLogReader(archive_path, True, "認証ユーザ1", status_archive)
+            assert list(reader.read()) == expected
+            assert status_archive == status
+            assert main.VRChatLogReader.is_read_all(archive_path, status_archive.pos)
+            assert list(main.VRChatLogReader(archive_path, True, "認証ユーザ1", status_archive).read()) == []
+
+            # 途中から
+            status_archive = main.entity.LogParserStatus(0, 0, None, None, None, None)
+            iterator = iter(main.VRChatLogReader(archive_path, True, "認証ユーザ1", status_archive).read())
+            next(iterator)
+            next(iterator)
+            iterator.close()
+            assert not main.VRChatLogReader.is_read_all(archive_path, status_archive.pos)
+            assert list(main.VRChatLogReader(archive_path, True, "認証ユーザ1", status_archive).read()) == expected[2:]
+
+        # 圧縮前のログと同じ識別子となり、記録を引き継ぐ
+        assert main.read_log_head(archive_paths[0]) == main.read_log_head(log_path)
+
+    def test_read_archive_trailing(self, tmp_path):
+        import gzip
+        from src import main
+        log_text = Path("tests/data/log/output_log_sample01.txt").read_bytes()
+        log_text += "2012.01.23 01:23:46 Log        -  [Network Processing] 解析対象外のログ\n\n".encode()
+        archive_paths = [tmp_path / "output_log_01.txt.gz"]
+        archive_paths[0].write_bytes(gzip.compress(log_text))
+        try:
+            import zstandard
+            archive_paths.append(tmp_path / "output_log_01.txt.zst")
+            archive_paths[1].write_bytes(zstandard.ZstdCompressor().compress(log_text))
+        except ImportError:
+            pass
+
+        for archive_path in archive_paths:
+            # 最後のイベント以降にイベント以外のレコードが続いても、全て読み込んだことが記録される
+            status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+            assert len(list(main.VRChatLogReader(archive_path, True, "認証ユーザ1", status).read())) > 0
+            assert status.pos == len(log_text)
+            assert main.VRChatLogReader.is_read_all(archive_path, status.pos)
+
+    def test_read_event(self):
+        import dataclasses
+        import pickle
+        from src import main
+        log_path = Path("tests/data/log/output_log_sample01.txt")
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        logs = list(main.VRChatLogReader(log_path, True, "認証ユーザ1", status).read())
+
+        # イベントは属性辞書を持たない不変の値となる
+        assert all(not hasattr(log, "__dict__") for log in logs)
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            logs[0].world_name = "ワールド名"
+        assert pickle.loads(pickle.dumps(logs)) == logs
+
+        # 同じ名前は同じ文字列を共有する
+        for key in ("world_id", "world_name", "user_display_name"):
+            values = [getattr(log, key) for log in logs if hasattr(log, key)]
+            assert len({id(val) for val in values}) == len(set(values))
+
     def test_read_log(self):
         from src import main
         status = main.entity.LogParserStatus(0, 0, "認証ユーザ1", "現在ワールドID", "現在ワールド名", "現在インスタンスID")
-        buff = open("tests/data/log/output_log_sample01.txt", "r")
+        buff = open("tests/data/log/output_log_sample01.txt", "rb")
         res = main.VRChatLogReader.read_log(buff, True, "認証ユーザ1", status)
         res = list(res)
         assert len(res) > 0
 
+    def test_read_file(self):
+        from src import main
+        # 読込み位置はファイル上のバイト数と一致する
+        log_path = Path("tests/data/log/output_log_sample01.txt")
+        status = main.entity.LogParserStatus(0, 0, "認証ユーザ1", None, None, None)
+        res = list(main.VRChatLogReader.read_file(log_path, True, "認証ユーザ1", status))
+        assert len(res) == 5
+        assert status.pos == log_path.stat().st_size
+
+        # 最新ログは最後のレコードの手前で止まる
+        status = main.entity.LogParserStatus(0, 0, "認証ユーザ1", None, None, None)
+        res = list(main.VRChatLogReader.read_file(log_path, False, "認証ユーザ1", status))
+        assert len(res) == 4
+        assert log_path.read_bytes()[status.pos:].startswith("2012.01.23 01:23:45 Log        -  [Behaviour] OnLeftRoom".encode("utf8"))
+
+        # ストリームから読んだ場合と同じ結果となる
+        status_stream = main.entity.LogParserStatus(0, 0, "認証ユーザ1", None, None, None)
+        with log_path.open("rb") as buff:
+            res_stream = list(main.VRChatLogReader.read_log(buff, False, "認証ユーザ1", status_stream))
+        assert res_stream == res
+        assert status_stream == status
+
+    def test_filter_records(self):
+        from src import main
+        log_buffer = Path("tests/data/log/output_log_sample01.txt").read_bytes()
+        records = list(main.VRChatLogSegmenter().split(log_buffer, len(log_buffer), True))
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        res = list(main.VRChatLogReader.filter_records(log_buffer, records, status))
+
+        # 警告と User Authenticated は読み飛ばし、位置のみ進める
+        assert res == records[2:]
+        assert status.pos == records[2][0]
+
     def test_proc_logevent_text_EnterRoom(self):
         from src import main
         status = main.entity.LogParserStatus(
@@ -240,6 +457,411 @@ class TestVRChatLogReader:
         assert res.world_name == "現在ワールド名"
         assert res.user_display_name == "ユーザ名"
 
+    def test_parse_timestamp(self):
+        from src import main
+        for text in ["2012.01.23 01:23:45", "2022.12.31 23:59:59", "2024.02.29 00:00:00"]:
+            res = main.VRChatLogReader.parse_timestamp(text)
+            assert res == datetime.datetime.strptime(text, "%Y.%m.%d %H:%M:%S")
+            assert res.tzinfo is None
+        with pytest.raises(ValueError):
+            main.VRChatLogReader.parse_timestamp("2023.02.29 00:00:00")
+
+
+class TestVRChatLogFollower:
+    LOG_RECORDS = [
+        "2012.01.23 01:23:45 Log        -  [Behaviour] Entering Room: ワールド名\n\n\n",
+        "2012.01.23 01:23:45 Log        -  [Behaviour] Joining wrld_xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx:99999~region(jp)\n\n\n",
+        "2012.01.23 01:23:45 Log        -  [Behaviour] Initialized PlayerAPI \"認証ユーザ1\" is local\n\n\n",
+        "2012.01.23 01:23:46 Log        -  [Behaviour] OnPlayerJoined ユーザ名\n\n\n",
+        "2012.01.23 01:23:47 Log        -  [Behaviour] OnPlayerLeft ユーザ名\n\n\n",
+        "2012.01.23 01:23:48 Log        -  [Behaviour] OnLeftRoom\n\n\n",
+    ]
+
+    def follow(self, log_dir: Path, watcher):
+        from src import main
+        log_path = log_dir / "output_log_01.txt"
+        log_path.write_text("".join(self.LOG_RECORDS[:2]), encoding="utf8")
+
+        # 追跡中に追記し、最後に新しいログを作成して追跡を終わらせる
+        idle_count = list()
+        def write_log():
+            for record in self.LOG_RECORDS[2:]:
+                time.sleep(0.1)
+                with log_path.open("a", encoding="utf8") as f:
+                    f.write(record)
+            time.sleep(0.6)
+            (log_dir / "output_log_02.txt").write_text("", encoding="utf8")
+        writer = threading.Thread(target=write_log)
+        writer.start()
+
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        follower = main.VRChatLogFollower(log_path, watcher, 0.2, lambda: idle_count.append(1), 0.5)
+        rotated_count = list()
+        is_rotated = follower.is_rotated
+        follower.is_rotated = lambda: rotated_count.append(1) or is_rotated()
+        reader = main.VRChatLogReader(log_path, True, "認証ユーザ1", status, follower)
+        time_start = time.monotonic()
+        logs = list(reader.read())
+        writer.join()
+        # 切り替わりの確認は書き込み毎ではなく、作成の通知時・一定間隔のみ
+        assert len(rotated_count) <= (time.monotonic() - time_start) / 0.5 + 2
+
+        assert [log.type for log in logs] == [
+            main.entity.LogEventType.JOIN_INSTANCE,
+            main.entity.LogEventType.INITIALIZE_API,
+            main.entity.LogEventType.ENTER_PLAYER,
+            main.entity.LogEventType.LEFT_PLAYER,
+            main.entity.LogEventType.LEFT_WORLD,
+        ]
+        assert status.pos == log_path.stat().st_size
+        assert len(idle_count) > 0
+        assert time.monotonic() - time_start < 5.0
+
+    def test_follow(self, tmp_path):
+        from src import main
+        watcher = main.VRChatLogWatcher(tmp_path)
+        try:
+            self.follow(tmp_path, watcher)
+        finally:
+            watcher.close()
+
+    def test_is_created(self):
+        from src import main
+        header = main.VRChatLogWatcher.EVENT_HEADER
+        modify = header.pack(1, main.VRChatLogWatcher.IN_MODIFY, 0, 16) + b"output_log_01.tx"
+        create = header.pack(1, main.VRChatLogWatcher.IN_CREATE, 0, 16) + b"output_log_02.tx"
+        assert not main.VRChatLogWatcher.is_created(b"")
+        assert not main.VRChatLogWatcher.is_created(modify * 3)
+        assert main.VRChatLogWatcher.is_created(modify + create)
+
+    def test_follow_polling(self, tmp_path):
+        from src import main
+        watcher = main.VRChatLogWatcher(tmp_path)
+        watcher.close()
+        assert watcher.is_polling
+        self.follow(tmp_path, watcher)
+
+
+class TestStageStats:
+    def test_add(self, tmp_path):
+        from src import main
+        target = main.StageStats()
+        for i in range(1, 101):
+            target.add("stage", i / 1000, 2, 10)
+        with target.measure("measure", 3, 30):
+            pass
+
+        res = target.to_dict()
+        assert res["stage"]["count"] == 200 and res["stage"]["bytes"] == 1000 and res["stage"]["calls"] == 100
+        assert res["stage"]["p50_ms"] == pytest.approx(50) and res["stage"]["p99_ms"] == pytest.approx(99) and res["stage"]["max_ms"] == pytest.approx(100)
+        assert res["measure"]["count"] == 3 and res["measure"]["bytes"] == 30
+        assert res["stage"]["unit"] == "call" and res["stage"]["avg_per_item_us"] == pytest.approx(25_250)
+
+        # 取り出した集計結果を統合できる (プロセスプールからの返却)
+        value = target.pop()
+        assert target.to_dict() == dict()
+        target.merge(value)
+        target.merge(value)
+        assert target.to_dict()["stage"]["count"] == 400
+
+        target.dump(tmp_path / "stats.json")
+        assert json.loads((tmp_path / "stats.json").read_text(encoding="utf8"))["stages"]["stage"]["calls"] == 200
+
+    def test_read(self):
+        from src import main
+        main.stats.pop()
+        log_path = Path("tests/data/log/output_log_sample01.txt")
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        logs = list(main.VRChatLogReader(log_path, True, "認証ユーザ1", status).read())
+
+        # 各処理段階が計上される
+        res = main.stats.pop()
+        assert {"io.mmap", "scan", "parse"} <= res.keys()
+        assert res["scan"]["bytes"] == log_path.stat().st_size
+        assert res["parse"]["count"] >= len(logs)
+        # (区切り・解析はレコード毎ではなくチャンク単位で計上される)
+        assert res["scan"]["unit"] == "chunk" and res["parse"]["unit"] == "chunk"
+
+        # ワーカの集計結果には、呼び出し元で集計済みの分を含めない
+        main.stats.add("scan", 0.0, 1, 100, "chunk")
+        _, _, res = main.read_logfile(log_path, True, "認証ユーザ1", main.entity.LogParserStatus(0, 0, None, None, None, None))
+        assert res["scan"]["bytes"] == log_path.stat().st_size
+
+
+class TestEventSpillBuffer:
+    def test_append(self):
+        from src import main
+        target = main.EventSpillBuffer(2)
+        for i in range(5):
+            target.append((i, f"イベント{i}"))
+        assert target.is_spilled
+        assert len(target) == 5
+        assert list(target) == [(i, f"イベント{i}") for i in range(5)]
+
+        # 読み出した後も追記できる
+        target.append((5, "イベント5"))
+        assert list(target) == [(i, f"イベント{i}") for i in range(6)]
+
+        target.clear()
+        assert not target.is_spilled
+        assert len(target) == 0 and list(target) == []
+
+
+class TestParserStateIndex:
+    def test_find(self, tmp_path):
+        from src import main
+        log_path = Path("tests/data/log/output_log_sample01.txt")
+        index = main.ParserStateIndex(tmp_path / "index" / f"{log_path.name}.index", 1)
+        status = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        logs = list(main.VRChatLogReader(log_path, True, "認証ユーザ1", status, index=index).read())
+        assert len(index.entries) > 1
+
+        # 再度読込んでも同じ内容となる
+        target = main.ParserStateIndex(tmp_path / "index" / f"{log_path.name}.index")
+        assert target.entries == index.entries
+
+        # 索引の位置から解析し直すと、先頭から解析した場合と同じ結果となる
+        # (間隔を1バイトとしたため、各イベントの直後の状態が記録されている)
+        assert len(target.entries) == len(logs)
+        for i, (entry_time, entry_status) in enumerate(target.entries):
+            res_status = target.find(pos=entry_status.pos)
+            assert res_status == entry_status
+            assert entry_time == logs[i].timestamp
+            res = list(main.VRChatLogReader(log_path, True, "認証ユーザ1", res_status).read())
+            assert res == logs[i + 1:]
+            assert res_status == status
+
+        # 時刻を指定した場合は、その時刻の全てのイベントより前の記録から解析し直す
+        # (同じ時刻のイベントが続く場合に、記録より前のイベントを取りこぼさない)
+        for entry_time, _ in target.entries:
+            res_status = target.find(timestamp=entry_time)
+            res = [log for log in main.VRChatLogReader(log_path, True, "認証ユーザ1", res_status).read() if log.timestamp >= entry_time]
+            assert res == [log for log in logs if log.timestamp >= entry_time]
+
+        # 索引より前の位置・時刻はファイルの先頭から
+        assert target.find(pos=0).pos == 0
+        assert target.find(timestamp=datetime.datetime(2000, 1, 1)).pos == 0
+
+        # 破棄した記録は読込まれない
+        target.reset()
+        assert target.entries == [] and main.ParserStateIndex(tmp_path / "index" / f"{log_path.name}.index").entries == []
+
+
+class TestActivityOutbox:
+    def test_put(self, tmp_path):
+        from src import main
+        entity = main.entity
+        timestamp = datetime.datetime(2012, 1, 23, 1, 23, 45)
+        activities = [
+            entity.LogEventEnterWorld(entity.LogEventType.JOIN_INSTANCE, timestamp, "99999", "wrld_xxx", "ワールド名"),
+            entity.LogEventLeftWorld(entity.LogEventType.LEFT_WORLD, timestamp, "99999", "wrld_xxx", "ワールド名"),
+            entity.LogEventEnterPlayer(entity.LogEventType.ENTER_PLAYER, timestamp, "99999", "wrld_xxx", "ワールド名", "ユーザ名"),
+            entity.LogEventLeftPlayer(entity.LogEventType.LEFT_PLAYER, timestamp, "99999", "wrld_xxx", "ワールド名", "ユーザ名"),
+        ]
+        target = main.ActivityOutbox(tmp_path / "outbox.sqlite3")
+        target.put(activities)
+        target.close()
+
+        # 再度開いても内容が残っている
+        target = main.ActivityOutbox(tmp_path / "outbox.sqlite3")
+        rows = target.peek(10)
+        assert [activity for _, activity in rows] == activities
+        target.remove(rows[1][0])
+        assert target.count() == 2
+        assert [activity for _, activity in target.peek(10)] == activities[2:]
+        target.close()
+
+
+class TestActivityUploader:
+    class FlakyStore:
+        # 指定回数だけ転送に失敗する書込み先
+        def __init__(self, fail_count: int):
+            self.activities = list()
+            self._fail_count = fail_count
+            self._lock = threading.Lock()
+
+        def put_activities(self, activities: list) -> None:
+            with self._lock:
+                if self._fail_count > 0:
+                    self._fail_count -= 1
+                    raise Exception("転送に失敗")
+                self.activities.extend(activities)
+
+    def test_put(self, tmp_path):
+        from src import main
+        entity = main.entity
+        timestamp = datetime.datetime(2012, 1, 23, 1, 23, 45)
+        activities = [
+            entity.LogEventEnterPlayer(entity.LogEventType.ENTER_PLAYER, timestamp, "99999", "wrld_xxx", "ワールド名", f"ユーザ名{i}")
+            for i in range(60)
+        ]
+        store = self.FlakyStore(2)
+        outbox = main.ActivityOutbox(tmp_path / "outbox.sqlite3")
+        main.ActivityUploader.BACKOFF_SEC, backoff_sec = 0.01, main.ActivityUploader.BACKOFF_SEC
+        target = main.ActivityUploader(store, outbox, 2, 25)
+        try:
+            target.put(activities[:30])
+            target.put(activities[30:])
+            # 失敗しても再試行され、全て転送されると送信箱が空になる
+            assert target.wait(10.0)
+        finally:
+            target.close()
+            main.ActivityUploader.BACKOFF_SEC = backoff_sec
+        assert outbox.count() == 0
+        # (失敗時は一括書込みの単位で再送するため、重複して転送されることがある)
+        assert {val.user_display_name for val in store.activities} == {val.user_display_name for val in activities}
+        outbox.close()
+
+
+    class PoisonStore:
+        # 特定のアクティビティを含む書込みのみ恒久的に失敗する書込み先
+        def __init__(self, poison_user: str):
+            self.activities = list()
+            self._poison_user = poison_user
+            self._lock = threading.Lock()
+
+        def put_activities(self, activities: list) -> None:
+            from botocore.exceptions import ClientError
+            with self._lock:
+                if any(val.user_display_name == self._poison_user for val in activities):
+                    raise ClientError({"Error": {"Code": "ValidationException"}}, "BatchWriteItem")
+                self.activities.extend(activities)
+
+    def test_put_poison(self, tmp_path):
+        from src import main
+        entity = main.entity
+        timestamp = datetime.datetime(2012, 1, 23, 1, 23, 45)
+        activities = [
+            entity.LogEventEnterPlayer(entity.LogEventType.ENTER_PLAYER, timestamp, "99999", "wrld_xxx", "ワールド名", f"ユーザ名{i}")
+            for i in range(60)
+        ]
+        store = self.PoisonStore("ユーザ名7")
+        outbox = main.ActivityOutbox(tmp_path / "outbox.sqlite3")
+        target = main.ActivityUploader(store, outbox, 2, 25)
+        try:
+            target.put(activities)
+            # 転送できないアクティビティのみ送信箱から外され、残りは転送される
+            assert target.wait(10.0)
+        finally:
+            target.close()
+        assert outbox.count() == 0
+        assert outbox.count_dead_letter() == 1
+        assert {val.user_display_name for val in store.activities} == {val.user_display_name for val in activities} - {"ユーザ名7"}
+        outbox.close()
+
+    def test_is_retryable(self):
+        from botocore.exceptions import ClientError, EndpointConnectionError
+        from src import main
+        assert main.ActivityUploader.is_retryable(ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "BatchWriteItem"))
+        assert main.ActivityUploader.is_retryable(EndpointConnectionError(endpoint_url="https://dynamodb.invalid"))
+        assert main.ActivityUploader.is_retryable(Exception("転送に失敗"))
+        assert not main.ActivityUploader.is_retryable(ClientError({"Error": {"Code": "ValidationException"}}, "BatchWriteItem"))
+        assert not main.ActivityUploader.is_retryable(ValueError())
+
+
+class TestAdaptiveBatchWriter:
+    class ThrottledStore:
+        # 指定した回の書込みでスロットリングが発生する書込み先
+        def __init__(self, throttle_rounds: set):
+            self.activities = list()
+            self.round = 0
+            self._throttle_rounds = throttle_rounds
+            self._lock = threading.Lock()
+
+        def put_activities(self, activities: list, retention: datetime.timedelta):
+            from src.common import dynamodb
+            with self._lock:
+                self.activities.extend(activities)
+            throttle_count = 1 if self.round in self._throttle_rounds else 0
+            return dynamodb.BatchWriteResult(len(activities), len(activities), throttle_count)
+
+    def test_write(self):
+        from src import main
+        store = self.ThrottledStore({3})
+        target = main.AdaptiveBatchWriter(store, 4, 0.0, None, 25)
+        concurrencies = list()
+        try:
+            for i in range(6):
+                store.round = i
+                concurrencies.append(target.concurrency)
+                target.write(list(range(target.round_len)))
+        finally:
+            target.close()
+
+        # スロットリングが発生するまで並行数を増やし、発生すれば半減する
+        assert concurrencies == [1, 2, 3, 4, 2, 3]
+        assert len(store.activities) == target.item_count == sum(concurrencies) * 25
+        assert target.consumed_capacity == target.item_count
+
+
+class TestCheckpointStore:
+    def test_save(self, tmp_path):
+        from src import main
+        value = {
+            "log_01.txt": main.entity.LogParserStatus(123, 1, "認証ユーザ", "ワールドID1", "ワールド名1", "インスタンスID1"),
+            "log_02.txt": main.entity.LogParserStatus(234, 1, "認証ユーザ", "ワールドID2", "ワールド名2", "インスタンスID2"),
+        }
+        target = main.CheckpointStore(tmp_path, "sample")
+        target.save(value)
+        assert (tmp_path / "sample.json").exists()
+        assert not (tmp_path / "sample.journal").exists()
+
+        # 変化したファイル分のみ追記される
+        value["log_02.txt"].pos = 345
+        value["log_03.txt"] = main.entity.LogParserStatus(0, 0, None, None, None, None)
+        del value["log_01.txt"]
+        target.save(value)
+        target.save(value)
+        lines = (tmp_path / "sample.journal").read_text(encoding="utf8").splitlines()
+        assert len(lines) == 4
+        assert json.loads(lines[0])[0] == main.CheckpointStore.GENERATION_KEY
+
+        res = main.CheckpointStore(tmp_path, "sample").load()
+        assert res == value
+
+        # 追記中に中断された行は無視される
+        with (tmp_path / "sample.journal").open("a", encoding="utf8") as f:
+            f.write('["log_02.txt",999')
+        res = main.CheckpointStore(tmp_path, "sample").load()
+        assert res == value
+
+    def test_compact(self, tmp_path):
+        from src import main
+        value = {"log_01.txt": main.entity.LogParserStatus(0, 1, "認証ユーザ", "ワールドID1", "ワールド名1", "インスタンスID1")}
+        target = main.CheckpointStore(tmp_path, "sample")
+        target.load()
+        for i in range(2000):
+            value["log_01.txt"].pos = i
+            target.save(value)
+
+        # 一定サイズを超えたジャーナルはスナップショットへ統合される
+        journal_path = tmp_path / "sample.journal"
+        assert not journal_path.exists() or journal_path.stat().st_size < main.CheckpointStore.JOURNAL_COMPACT_SIZE
+        assert main.CheckpointStore(tmp_path, "sample").load() == value
+
+    def test_compact_interrupted(self, tmp_path):
+        from src import main
+        value = {"log_01.txt": main.entity.LogParserStatus(0, 1, "認証ユーザ", "ワールドID1", "ワールド名1", "インスタンスID1")}
+        target = main.CheckpointStore(tmp_path, "sample")
+        target.load()
+        target.save(value)
+        value["log_01.txt"].pos = 100
+        target.save(value)
+        journal_text = (tmp_path / "sample.journal").read_text(encoding="utf8")
+
+        # スナップショットの置き換え後、ジャーナルの破棄前に中断された場合は古いジャーナルを適用しない
+        value["log_01.txt"].pos = 200
+        main.CheckpointStore(tmp_path, "sample").compact(value)
+        (tmp_path / "sample.journal").write_text(journal_text, encoding="utf8")
+        target = main.CheckpointStore(tmp_path, "sample")
+        assert target.load() == value
+        assert not (tmp_path / "sample.journal").exists()
+
+        # 読み込んだ記録へ続けて追記できる
+        value["log_01.txt"].pos = 300
+        target.save(value)
+        assert main.CheckpointStore(tmp_path, "sample").load() == value
+
 
 class TestApp:
     def setup(self):
@@ -331,3 +953,91 @@ class TestApp:
             assert obj["CurrentWorldName"] == "ワールド名3"
             assert obj["Pos"] == 345
             assert obj["VisitedWorldCount"] == 0
+
+    def test_enqueue_worker(self, tmp_path, monkeypatch):
+        from src import main
+        enqueued = list()
+
+        class WorkerService:
+            def __init__(self, *args):
+                pass
+
+            def enqueue(self):
+                enqueued.append(True)
+
+        monkeypatch.setattr(main.sqs, "WorkerService", WorkerService)
+        app = object.__new__(main.App)
+        app._enqueue_path = tmp_path / "outbox" / "sample.enqueue"
+        app._is_enabled_ewq = True
+        app._account_id = app._put_queue_name = app._aws_sess = None
+
+        # 未転送分が残る間はキューイングを保留し、送信箱が空になった時点でキューイング
+        app.enqueue_worker(True, False)
+        assert enqueued == [] and app._enqueue_path.exists()
+        app.enqueue_worker(False, False)
+        assert enqueued == []
+        app.enqueue_worker(False, True)
+        assert enqueued == [True] and not app._enqueue_path.exists()
+        app.enqueue_worker(False, True)
+        assert enqueued == [True]
+
+    def test_match_status(self, tmp_path):
+        from src import main
+        log_text = Path("tests/data/log/output_log_sample01.txt").read_bytes()
+        (tmp_path / "output_log_01.txt").write_bytes(log_text)
+        status = main.App.match_status(tmp_path, dict())
+        assert status["output_log_01.txt"].pos == 0
+        assert status["output_log_01.txt"].fingerprint is not None
+        status["output_log_01.txt"].pos = 100
+
+        # 名前が変わっても同じ記録・索引を引き継ぐ (同じ内容のログは1つのみ)
+        index_dir = tmp_path / "index"
+        index_dir.mkdir()
+        (index_dir / "output_log_01.txt.index").write_text("")
+        (tmp_path / "output_log_01.txt").rename(tmp_path / "output_log_02.txt")
+        (tmp_path / "output_log_03.txt").write_bytes(log_text)
+        res = main.App.match_status(tmp_path, status, index_dir)
+        assert list(res.keys()) == ["output_log_02.txt"]
+        assert res["output_log_02.txt"].pos == 100
+        assert not (index_dir / "output_log_01.txt.index").exists()
+        assert (index_dir / "output_log_02.txt.index").exists()
+
+        # 切り詰められたログ・置き換えられたログは最初から
+        (tmp_path / "output_log_02.txt").write_bytes(log_text[:50])
+        (tmp_path / "output_log_03.txt").write_bytes(log_text.replace(b"2012.01.23", b"2012.01.24"))
+        res["output_log_03.txt"] = main.entity.LogParserStatus(100, 0, None, None, None, None, status["output_log_01.txt"].fingerprint)
+        (index_dir / "output_log_03.txt.index").write_text("")
+        res = main.App.match_status(tmp_path, res, index_dir)
+        assert res["output_log_02.txt"].pos == 0
+        assert res["output_log_03.txt"].pos == 0
+        assert not (index_dir / "output_log_02.txt.index").exists()
+        assert not (index_dir / "output_log_03.txt.index").exists()
+
+    def test_match_status_small(self, tmp_path):
+        from src import main
+        log_text = Path("tests/data/log/output_log_sample01.txt").read_bytes()
+        log_text = log_text * (8192 // len(log_text) + 1)
+
+        # 識別子の長さに満たない書込み中のログも、書き込まれた後に同じログとして対応付ける
+        (tmp_path / "output_log_01.txt").write_bytes(log_text[:1000])
+        status = main.App.match_status(tmp_path, dict())
+        assert status["output_log_01.txt"].fingerprint.startswith("1000:")
+        status["output_log_01.txt"].pos = 900
+
+        (tmp_path / "output_log_01.txt").write_bytes(log_text)
+        (tmp_path / "output_log_01.txt").rename(tmp_path / "output_log_02.txt")
+        res = main.App.match_status(tmp_path, status)
+        assert list(res.keys()) == ["output_log_02.txt"]
+        assert res["output_log_02.txt"].pos == 900
+        assert res["output_log_02.txt"].fingerprint.startswith("4096:")
+
+    def test_is_logfile_in_range(self):
+        from src import main
+        since = main.parse_datetime("2012-01-23")
+        until = main.parse_datetime("2012-01-23", True)
+        assert until == datetime.datetime(2012, 1, 24)
+        assert main.is_logfile_in_range("output_log_2012-01-23_01-23-45.txt", since, until)
+        assert main.is_logfile_in_range("output_log_2012-01-23_01-23-45.txt.gz", since, until)
+        assert not main.is_logfile_in_range("output_log_2012-01-24_00-00-00.txt", since, until)
+        assert not main.is_logfile_in_range("output_log_2012-01-22_23-59-59.txt", since, None)
+        assert main.is_logfile_in_range("output_log_sample01.txt", since, until)
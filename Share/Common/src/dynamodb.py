@@ -1,12 +1,19 @@
 import boto3
+import hashlib
 import logging
+import random
 import tempfile
+import threading
 import time
 import zoneinfo
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Iterable
 from http.cookiejar import CookieJar, MozillaCookieJar
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+from concurrent.futures import ThreadPoolExecutor
 from .entity import *
 
 
@@ -17,17 +24,124 @@ class AccountInfo:
     cookies: CookieJar
 
 
+@dataclass
+class BatchWriteResult:
+    item_count: int
+    consumed_capacity: float
+    throttle_count: int
+
+
+@dataclass
+class ShardConfig:
+    # アクティビティを書込むパーティションの分割数とハッシュ関数
+    # (read_shard_count は読み手が問い合わせる範囲。分割数の変更中は旧・新の大きい方となる)
+    shard_count: int
+    shard_hash: str
+    read_shard_count: int
+
+    def get_shard(self, val_sk: str) -> int:
+        if self.shard_hash == "sum":
+            # 従来の配置 (バイト値の総和。偏りが大きいため新規には使用しない)
+            return sum(val_sk.encode()) % self.shard_count
+        digest = hashlib.blake2b(val_sk.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.shard_count
+
+
+class TokenBucket:
+    # 消費キャパシティ (ユニット/秒) の流量制御
+    # 消費量は応答を受けるまで分からないため、見積りで前借りし、不足分だけ待機した上で実績との差を精算する
+    # スロットリングを受けると流量を実績の半分へ下げ、成功が続くと実績の一定割合ずつ戻す
+    RATE_MIN: float = 1.0
+    RATE_INCREASE_RATIO: float = 0.1
+
+    def __init__(self, max_rate: float):
+        self._lock = threading.Lock()
+        self._max_rate = max_rate
+        self._rate = max_rate
+        self._tokens = max_rate
+        self._time = time.monotonic()
+        self._window_time = self._time
+        self._window_units = 0.0
+        self._measured_rate = max_rate
+
+    @property
+    def rate(self) -> float: return self._rate
+
+    def acquire(self, units: float) -> None:
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+            wait_sec = -self._tokens / self._rate if self._tokens < 0 else 0.0
+        if wait_sec > 0:
+            time.sleep(wait_sec)
+
+    def settle(self, estimated_units: float, consumed_units: float) -> None:
+        with self._lock:
+            self._tokens += estimated_units - consumed_units
+            self._measure(consumed_units)
+            self._rate = min(self._max_rate, self._rate + consumed_units * self.RATE_INCREASE_RATIO)
+
+    def throttle(self) -> None:
+        with self._lock:
+            self._measure(0.0)
+            self._rate = max(self.RATE_MIN, min(self._rate, self._measured_rate) / 2)
+            self._tokens = min(self._tokens, 0.0)
+
+    def _refill(self) -> None:
+        # 溜められるトークンは1秒分まで
+        now = time.monotonic()
+        self._tokens = min(self._rate, self._tokens + (now - self._time) * self._rate)
+        self._time = now
+
+    def _measure(self, consumed_units: float) -> None:
+        # 直近1秒以上の区間の消費量から実績の流量を求める
+        now = time.monotonic()
+        self._window_units += consumed_units
+        elapsed = now - self._window_time
+        if elapsed >= 1.0:
+            self._measured_rate = self._window_units / elapsed
+            self._window_time = now
+            self._window_units = 0.0
+
+
 class Service:
     SUFFIX_LEN: int = 3
+    BATCH_WRITE_LEN: int = 25
+    FRIENDS_PAGE_LEN: int = 1000
+    QUERY_WORKERS: int = 16
+    SHARD_HASH: str = "blake2b"
+    SHARD_CONFIG_TTL_SEC: float = 300.0
+    RETRY_MAX: int = 8
+    RETRY_BACKOFF_SEC: float = 0.1
+    RETRY_BACKOFF_MAX_SEC: float = 10.0
+    RETRY_ERROR_CODES = {
+        "ProvisionedThroughputExceededException", "RequestLimitExceeded", "ThrottlingException",
+        "InternalServerError", "ServiceUnavailable"
+    }
+    # 再試行は request_with_retry で行うため、SDK 側の再試行は無効化して二重に再試行しない
+    CLIENT_CONFIG = Config(retries={"total_max_attempts": 1})
+    ENCOUNTER_CACHE_LEN: int = 100_000
+    READ_CAPACITY_MAX: float = 3000.0
+    WRITE_CAPACITY_MAX: float = 1000.0
     TZ_UTC = zoneinfo.ZoneInfo("UTC")
+    _executor: ThreadPoolExecutor = None
+    _executor_lock = threading.Lock()
 
-    def __init__(self, account_id: str, get_table_name: str, put_table_name: str, aws_sess: boto3.Session, logger: logging.Logger):
+    def __init__(self, account_id: str, get_table_name: str, put_table_name: str, aws_sess: boto3.Session, logger: logging.Logger,
+                 read_capacity: float = None, write_capacity: float = None):
+        # 流量の上限 (ユニット/秒) は省略時は1パーティションの上限とし、スロットリングに応じて下げる
         self._account_id = account_id
-        self._dynamodb = aws_sess.client("dynamodb")
-        self._dynamodb_res = aws_sess.resource("dynamodb")
+        self._dynamodb = aws_sess.client("dynamodb", config=self.CLIENT_CONFIG)
+        self._dynamodb_res = aws_sess.resource("dynamodb", config=self.CLIENT_CONFIG)
         self._get_table = self._dynamodb_res.Table(get_table_name)
         self._put_table = self._dynamodb_res.Table(put_table_name)
         self._logger = logger
+        self._read_bucket = TokenBucket(read_capacity or self.READ_CAPACITY_MAX)
+        self._write_bucket = TokenBucket(write_capacity or self.WRITE_CAPACITY_MAX)
+        self._shard_config: ShardConfig = None
+        self._shard_config_expire = 0.0
+        self._encounter_cache: dict[str, tuple[str, str]] = dict()
+        self._encounter_lock = threading.Lock()
 
     def put_account(self, info: AccountInfo, update_date: datetime = None) -> None:
         update_unixtime = int(update_date.timestamp()) if update_date is not None else None
@@ -50,7 +164,8 @@ class Service:
         exp_values = {f":{key}_val": val for key, val in exp_base}
 
         # 更新クエリを実行
-        self._put_table.update_item(
+        self._request(
+            self._write_bucket, self._put_table.update_item,
             Key={
                 "pk": "#app:monitoring_accounts",
                 "sk": f"#account:{self._account_id}"
@@ -60,7 +175,7 @@ class Service:
         )
 
     def get_account(self) -> AccountInfo:
-        res_api = self._get_table.get_item(Key={
+        res_api = self._request(self._read_bucket, self._get_table.get_item, Key={
             "pk": "#app:monitoring_accounts",
             "sk": f"#account:{self._account_id}"
         })
@@ -71,7 +186,7 @@ class Service:
         return AccountInfo(vrchat_user_name, vrchat_passwd, cookies)
 
     def del_account(self) -> None:
-        self._get_table.delete_item(Key={
+        self._request(self._write_bucket, self._get_table.delete_item, Key={
             "pk": "#app:monitoring_accounts",
             "sk": f"#account:{self._account_id}"
         })
@@ -87,7 +202,8 @@ class Service:
         exp_values = {f":{key}_val": val for key, val in exp_base}
 
         # 更新クエリを実行
-        self._put_table.update_item(
+        self._request(
+            self._write_bucket, self._put_table.update_item,
             Key={
                 "pk": f"#account:{self._account_id}",
                 "sk": f"#connect:{app_name}"
@@ -97,7 +213,7 @@ class Service:
         )
 
     def get_app_metadata(self, app_name: str) -> dict[str, str]:
-        res_api = self._get_table.get_item(Key={
+        res_api = self._request(self._read_bucket, self._get_table.get_item, Key={
             "pk": f"#account:{self._account_id}",
             "sk": f"#connect:{app_name}"
         })
@@ -109,184 +225,300 @@ class Service:
         return res_api
 
     def disconnect_app(self, app_name: str) -> None:
-        self._put_table.delete_item(
+        self._request(
+            self._write_bucket, self._put_table.delete_item,
             Key={
                 "pk": f"#account:{self._account_id}",
                 "sk": f"#connect:{app_name}"
             }
         )
 
-    def get_friends(self) -> list[UserInfo]:
-        db_res = self._get_table.query(
-            KeyConditionExpression="pk = :pk and begins_with(sk, :sk)",
-            ExpressionAttributeValues={
+    def get_friends(self, page_size: int = None) -> Iterable[UserInfo]:
+        # 1回の応答は 1MB までのため、続きが無くなるまで取得しながら返す
+        # (必要な属性のみ取得し、ページ当たりの件数で使用メモリを調整)
+        params = {
+            "KeyConditionExpression": "pk = :pk and begins_with(sk, :sk)",
+            "ExpressionAttributeValues": {
                 ":pk": f"#account:{self._account_id}",
                 ":sk": "#friend:"
-            }
-        )
-        friend_infos = [
-            UserInfo(
-                item["user_id"], item["user_display_name"],
-                item.get("regist_date"), item["update_date"]
-            )
-            for item in db_res["Items"]
-        ]
-        return friend_infos
-
-    def put_friend(self, op: OperationInfo) -> None:
-        # 失敗した場合には再試行。2回失敗した場合は catch 句で中断させる
-        for i in range(2):
-            try:
-                if op.action == ActionType.MIGRATION:
-                    self._put_table.put_item(
-                        Item={
-                            "pk": f"#account:{self._account_id}",
-                            "sk": f"#friend:{op.info_new.user_id}",
-                            "user_id": op.info_new.user_id,
-                            "user_display_name": op.info_new.user_display_name,
-                            "regist_date": op.info_new.regist_date,
-                            "update_date": op.info_new.update_date
-                        }
-                    )
-                elif op.action == ActionType.ADD:
-                    self._put_table.put_item(
-                        Item={
-                            "pk": f"#account:{self._account_id}",
-                            "sk": f"#friend:{op.info_new.user_id}",
-                            "user_id": op.info_new.user_id,
-                            "user_display_name": op.info_new.user_display_name,
-                            "regist_date": op.info_new.update_date,
-                            "update_date": op.info_new.update_date
-                        }
-                    )
-                elif (op.action == ActionType.UPDATE):
-                    self._put_table.put_item(
-                        Item={
-                            "pk": f"#account:{self._account_id}",
-                            "sk": f"#friend:{op.info_new.user_id}",
-                            "user_id": op.info_new.user_id,
-                            "user_display_name": op.info_new.user_display_name,
-                            "regist_date": op.info_old.regist_date,
-                            "update_date": op.info_new.update_date
-                        }
-                    )
-                elif (op.action == ActionType.REMOVE):
-                    self._put_table.delete_item(
-                        Key={
-                            "pk": f"#account:{self._account_id}",
-                            "sk": f"#friend:{op.info_old.user_id}"
-                        }
-                    )
-                else:
-                    raise Exception("想定外のエラーが発生しました")
+            },
+            "ProjectionExpression": "user_id, user_display_name, regist_date, update_date",
+            "Limit": page_size or self.FRIENDS_PAGE_LEN
+        }
+        while True:
+            db_res = self._request(self._read_bucket, self._get_table.query, **params)
+            for item in db_res["Items"]:
+                yield UserInfo(
+                    item["user_id"], item["user_display_name"],
+                    item.get("regist_date"), item["update_date"]
+                )
 
-                time.sleep(0.1)
+            # 続きが無ければ処理終了
+            if "LastEvaluatedKey" not in db_res:
                 break
-            except self._dynamodb.exceptions.ProvisionedThroughputExceededException as ex:
-                time.sleep(10)
-                self._logger.warning("キャパシティ超過")
+            params["ExclusiveStartKey"] = db_res["LastEvaluatedKey"]
+
+    def put_friend(self, op: OperationInfo) -> None:
+        if op.action == ActionType.MIGRATION:
+            self._request(
+                self._write_bucket, self._put_table.put_item,
+                Item={
+                    "pk": f"#account:{self._account_id}",
+                    "sk": f"#friend:{op.info_new.user_id}",
+                    "user_id": op.info_new.user_id,
+                    "user_display_name": op.info_new.user_display_name,
+                    "regist_date": op.info_new.regist_date,
+                    "update_date": op.info_new.update_date
+                }
+            )
+        elif op.action == ActionType.ADD:
+            self._request(
+                self._write_bucket, self._put_table.put_item,
+                Item={
+                    "pk": f"#account:{self._account_id}",
+                    "sk": f"#friend:{op.info_new.user_id}",
+                    "user_id": op.info_new.user_id,
+                    "user_display_name": op.info_new.user_display_name,
+                    "regist_date": op.info_new.update_date,
+                    "update_date": op.info_new.update_date
+                }
+            )
+        elif (op.action == ActionType.UPDATE):
+            self._request(
+                self._write_bucket, self._put_table.put_item,
+                Item={
+                    "pk": f"#account:{self._account_id}",
+                    "sk": f"#friend:{op.info_new.user_id}",
+                    "user_id": op.info_new.user_id,
+                    "user_display_name": op.info_new.user_display_name,
+                    "regist_date": op.info_old.regist_date,
+                    "update_date": op.info_new.update_date
+                }
+            )
+        elif (op.action == ActionType.REMOVE):
+            self._request(
+                self._write_bucket, self._put_table.delete_item,
+                Key={
+                    "pk": f"#account:{self._account_id}",
+                    "sk": f"#friend:{op.info_old.user_id}"
+                }
+            )
+        else:
+            raise Exception("想定外のエラーが発生しました")
 
     def put_activity(self, activity: LogEvent) -> None:
-        timestamp = activity.timestamp.astimezone()
-        timestamp_id = timestamp.astimezone(self.TZ_UTC).strftime("%Y%m%d_%H%M%S")
-        timestamp_text = timestamp.isoformat()
         # レコード有効期限を秒単位の UNIXTIME として生成
         expiration_time = datetime.now()
         expiration_time = expiration_time + timedelta(hours=24)
         expiration_time = int(expiration_time.timestamp())
+        item = self._create_activity_item(activity, expiration_time, self.get_shard_config())
+        if item is None:
+            return
+        self._request(self._write_bucket, self._put_table.put_item, Item=item)
+        self._put_encounters([activity])
 
-        i = 0
-        while True:
+    def put_activities(self, activities: list[LogEvent], retention: timedelta = timedelta(hours=24)) -> BatchWriteResult:
+        # レコード有効期限を秒単位の UNIXTIME として生成 (retention が None の場合は無期限)
+        expiration_time = None
+        if retention is not None:
+            expiration_time = datetime.now()
+            expiration_time = expiration_time + retention
+            expiration_time = int(expiration_time.timestamp())
+
+        # 同一キーのレコードは後のもので上書き (同一バッチ内でのキーの重複は許されない)
+        items = dict()
+        shard_config = self.get_shard_config()
+        for activity in activities:
+            item = self._create_activity_item(activity, expiration_time, shard_config)
+            if item is not None:
+                if expiration_time is None:
+                    del item["expiration_time"]
+                items[(item["pk"], item["sk"])] = item
+        items = list(items.values())
+
+        result = BatchWriteResult(0, 0.0, 0)
+        for i in range(0, len(items), self.BATCH_WRITE_LEN):
+            requests = [{"PutRequest": {"Item": item}} for item in items[i:i + self.BATCH_WRITE_LEN]]
+            self._batch_write(requests, result)
+        result.consumed_capacity += self._put_encounters(activities)
+        return result
+
+    def _batch_write(self, requests: list[dict], result: BatchWriteResult) -> None:
+        # 未処理のリクエストは間隔を空けながら再送し、全て処理されるまで戻らない
+        table_name = self._put_table.name
+        result.item_count += len(requests)
+        for i in range(self.RETRY_MAX):
+            res_api = self._request(
+                self._write_bucket, self._dynamodb_res.batch_write_item, len(requests),
+                RequestItems={table_name: requests})
+            result.consumed_capacity += self.get_consumed_capacity(res_api)
+            requests = res_api.get("UnprocessedItems", dict()).get(table_name, list())
+            if len(requests) == 0:
+                return
+            self._logger.warning(f"DynamoDB 一括書き込みで未処理の項目が発生 ({len(requests)} 件).")
+            self._write_bucket.throttle()
+            result.throttle_count += 1
+            time.sleep(self.get_backoff_sec(i))
+
+        raise Exception(f"DynamoDB 一括書き込みに失敗. 再試行回数を超過しました ({self.RETRY_MAX}回).")
+
+    def _request(self, bucket: TokenBucket, func, estimated_units: float = 1.0, **params) -> dict:
+        return self.request_with_retry(bucket, self._logger, func, estimated_units, **params)
+
+    @staticmethod
+    def request_with_retry(bucket: TokenBucket, logger: logging.Logger, func, estimated_units: float = 1.0, **params) -> dict:
+        # 全ての読み書きで共通の再試行と流量制御
+        # (スロットリング等の一時的なエラーは間隔を空けて再試行し、消費キャパシティの実績で流量を調整)
+        # (接続・通信のエラーも同様に再試行するが、流量は下げない)
+        params["ReturnConsumedCapacity"] = "TOTAL"
+        for i in range(Service.RETRY_MAX + 1):
+            bucket.acquire(estimated_units)
             try:
-                if isinstance(activity, LogEventEnterWorld):
-                    val_sk = f"#activity:world.enter#timestamp:{timestamp_id}"
-                    val_suffix = sum(val_sk.encode()) % self.SUFFIX_LEN
-                    self._put_table.put_item(Item={
-                        "pk": f"#account:{self._account_id}#suffix:{val_suffix}",
-                        "sk": val_sk,
-                        "instance_id": activity.instance_id,
-                        "world_id": activity.world_id,
-                        "world_name": activity.world_name,
-                        "timestamp": timestamp_text,
-                        "expiration_time": expiration_time
-                    })
-                elif isinstance(activity, LogEventLeftWorld):
-                    val_sk = f"#activity:world.left#timestamp:{timestamp_id}"
-                    val_suffix = sum(val_sk.encode()) % self.SUFFIX_LEN
-                    self._put_table.put_item(Item={
-                        "pk": f"#account:{self._account_id}#suffix:{val_suffix}",
-                        "sk": val_sk,
-                        "instance_id": activity.instance_id,
-                        "world_id": activity.world_id,
-                        "world_name": activity.world_name,
-                        "timestamp": timestamp_text,
-                        "expiration_time": expiration_time
-                    })
-                elif isinstance(activity, LogEventEnterPlayer):
-                    username_esc = activity.user_display_name
-                    username_esc = username_esc.replace("\\", "\\\\")
-                    username_esc = username_esc.replace("#", "\\u0023")
-                    username_esc = username_esc.replace(":", "\\u003a")
-                    val_sk = f"#activity:user.enter.{username_esc}#timestamp:{timestamp_id}"
-                    val_suffix = sum(val_sk.encode()) % self.SUFFIX_LEN
-                    self._put_table.put_item(Item={
-                        "pk": f"#account:{self._account_id}#suffix:{val_suffix}",
-                        "sk": val_sk,
-                        "instance_id": activity.instance_id,
-                        "world_id": activity.world_id,
-                        "world_name": activity.world_name,
-                        "user_display_name": activity.user_display_name,
-                        "timestamp": timestamp_text,
-                        "expiration_time": expiration_time
-                    })
-                elif isinstance(activity, LogEventLeftPlayer):
-                    username_esc = activity.user_display_name
-                    username_esc = username_esc.replace("\\", "\\\\")
-                    username_esc = username_esc.replace("#", "\\u0023")
-                    username_esc = username_esc.replace(":", "\\u003a")
-                    val_sk = f"#activity:user.left.{username_esc}#timestamp:{timestamp_id}"
-                    val_suffix = sum(val_sk.encode()) % self.SUFFIX_LEN
-                    self._put_table.put_item(Item={
-                        "pk": f"#account:{self._account_id}#suffix:{val_suffix}",
-                        "sk": val_sk,
-                        "instance_id": activity.instance_id,
-                        "world_id": activity.world_id,
-                        "world_name": activity.world_name,
-                        "user_display_name": activity.user_display_name,
-                        "timestamp": timestamp_text,
-                        "expiration_time": expiration_time
-                    })
-                break
-            except self.dynamodb.exceptions.ProvisionedThroughputExceededException as ex:
-                if i > 1:
-                    self._logger.warning("DynamoDB 書き込みでキャパシティ超過を起因とした複数回のエラーが発生.")
-                    raise
+                res_api = func(**params)
+            except (ClientError, BotoConnectionError, HTTPClientError) as ex:
+                if isinstance(ex, ClientError):
+                    error_code = ex.response.get("Error", dict()).get("Code")
+                    if error_code not in Service.RETRY_ERROR_CODES:
+                        raise
+                    bucket.settle(estimated_units, 0.0)
+                    bucket.throttle()
                 else:
-                    self._logger.warning("DynamoDB 書き込みでキャパシティ超過を起因とした複数回のエラーが発生 (10秒後に再試行).")
-                    time.sleep(10)
+                    error_code = type(ex).__name__
+                    bucket.settle(estimated_units, 0.0)
+                if i == Service.RETRY_MAX:
+                    logger.warning(f"DynamoDB への要求で一時的なエラーが続いたため中断 ({error_code}).")
+                    raise
+                backoff_sec = Service.get_backoff_sec(i)
+                logger.warning(f"DynamoDB への要求で一時的なエラーが発生 ({error_code}, {backoff_sec:.2f}秒後に再試行).")
+                time.sleep(backoff_sec)
+                continue
+            bucket.settle(estimated_units, Service.get_consumed_capacity(res_api))
+            return res_api
+
+    @staticmethod
+    def get_backoff_sec(retry_count: int) -> float:
+        # 指数バックオフ (同時に失敗した要求の再試行が揃わないよう、上限内で無作為に待機)
+        return random.uniform(0, min(Service.RETRY_BACKOFF_MAX_SEC, Service.RETRY_BACKOFF_SEC * 2 ** retry_count))
+
+    @staticmethod
+    def get_consumed_capacity(res_api: dict) -> float:
+        # テーブル単位の操作は dict、一括操作は list で返される
+        consumed = res_api.get("ConsumedCapacity", list())
+        consumed = [consumed] if isinstance(consumed, dict) else consumed
+        return sum(val.get("CapacityUnits", 0.0) for val in consumed)
+
+    def _create_activity_item(self, activity: LogEvent, expiration_time: int, shard_config: ShardConfig) -> dict:
+        timestamp = activity.timestamp.astimezone()
+        timestamp_id = timestamp.astimezone(self.TZ_UTC).strftime("%Y%m%d_%H%M%S")
+        timestamp_text = timestamp.isoformat()
+
+        if isinstance(activity, LogEventEnterWorld):
+            val_sk = f"#activity:world.enter#timestamp:{timestamp_id}"
+            val_suffix = shard_config.get_shard(val_sk)
+            return {
+                "pk": f"#account:{self._account_id}#suffix:{val_suffix}",
+                "sk": val_sk,
+                "instance_id": activity.instance_id,
+                "world_id": activity.world_id,
+                "world_name": activity.world_name,
+                "timestamp": timestamp_text,
+                "expiration_time": expiration_time
+            }
+        elif isinstance(activity, LogEventLeftWorld):
+            val_sk = f"#activity:world.left#timestamp:{timestamp_id}"
+            val_suffix = shard_config.get_shard(val_sk)
+            return {
+                "pk": f"#account:{self._account_id}#suffix:{val_suffix}",
+                "sk": val_sk,
+                "instance_id": activity.instance_id,
+                "world_id": activity.world_id,
+                "world_name": activity.world_name,
+                "timestamp": timestamp_text,
+                "expiration_time": expiration_time
+            }
+        elif isinstance(activity, LogEventEnterPlayer):
+            username_esc = self.escape_username(activity.user_display_name)
+            val_sk = f"#activity:user.enter.{username_esc}#timestamp:{timestamp_id}"
+            val_suffix = shard_config.get_shard(val_sk)
+            return {
+                "pk": f"#account:{self._account_id}#suffix:{val_suffix}",
+                "sk": val_sk,
+                "instance_id": activity.instance_id,
+                "world_id": activity.world_id,
+                "world_name": activity.world_name,
+                "user_display_name": activity.user_display_name,
+                "timestamp": timestamp_text,
+                "expiration_time": expiration_time
+            }
+        elif isinstance(activity, LogEventLeftPlayer):
+            username_esc = self.escape_username(activity.user_display_name)
+            val_sk = f"#activity:user.left.{username_esc}#timestamp:{timestamp_id}"
+            val_suffix = shard_config.get_shard(val_sk)
+            return {
+                "pk": f"#account:{self._account_id}#suffix:{val_suffix}",
+                "sk": val_sk,
+                "instance_id": activity.instance_id,
+                "world_id": activity.world_id,
+                "world_name": activity.world_name,
+                "user_display_name": activity.user_display_name,
+                "timestamp": timestamp_text,
+                "expiration_time": expiration_time
+            }
+        return None
 
     def find_first_activity(self, target: UserInfo, max_datetime: datetime, delta: timedelta = timedelta(hours=6)) -> LogEventEnterPlayer:
-        res = list()
+        # 指定日時までの一定期間内で最初の遭遇を、ユーザ毎の遭遇の記録から求める
+        # (期間内に遭遇が無ければ直近の遭遇を返すため、アクティビティの保持期間に依らない)
+        # 記録の無いユーザと、期間内の最初の遭遇が記録から分からない場合のみアクティビティを検索
+        max_datetime = max_datetime.astimezone().astimezone(self.TZ_UTC)
+        min_datetime = max_datetime - delta
+        res_api = self._request(self._read_bucket, self._get_table.get_item, Key={
+            "pk": f"#account:{self._account_id}#encounter:{self.escape_username(target.user_display_name)}",
+            "sk": "#encounter"
+        })
+        item = res_api.get("Item")
+        if item is None:
+            return self._query_first_activity(target, max_datetime, delta)
+
+        first = self._encounter_to_activity(item, "first")
+        last = self._encounter_to_activity(item, "last")
+        if first.timestamp > max_datetime:
+            return None
+        if first.timestamp >= min_datetime:
+            return first
+        if last.timestamp < min_datetime:
+            return last
+        res = self._query_first_activity(target, max_datetime, delta)
+        if res is not None:
+            return res
+        return last if last.timestamp <= max_datetime else first
+
+    def _query_first_activity(self, target: UserInfo, max_datetime: datetime, delta: timedelta) -> LogEventEnterPlayer:
+        # 各シャードの最初の項目を並行して取得し、最も古いものを返す
+        # (ソートキーの時刻部分は UTC のため、ソートキーの比較で時刻順となる)
         max_datetime = max_datetime.astimezone().astimezone(self.TZ_UTC)
-        for suffix in range(self.SUFFIX_LEN):
-            min_datetime_txt = (max_datetime - delta).strftime("%Y%m%d_%H%M%S")
-            max_datetime_txt = (max_datetime + timedelta(seconds=1)).strftime("%Y%m%d_%H%M%S")
-            pk = f"#account:{self._account_id}#suffix:{suffix}"
-            sk1 = f"#activity:user.enter.{target.user_display_name}#timestamp:{min_datetime_txt}"
-            sk2 = f"#activity:user.enter.{target.user_display_name}#timestamp:{max_datetime_txt}"
-            res_api = self._get_table.query(
+        min_datetime_txt = (max_datetime - delta).strftime("%Y%m%d_%H%M%S")
+        max_datetime_txt = (max_datetime + timedelta(seconds=1)).strftime("%Y%m%d_%H%M%S")
+        username_esc = self.escape_username(target.user_display_name)
+        sk1 = f"#activity:user.enter.{username_esc}#timestamp:{min_datetime_txt}"
+        sk2 = f"#activity:user.enter.{username_esc}#timestamp:{max_datetime_txt}"
+
+        def query_shard(suffix: int) -> list[dict]:
+            res_api = self._request(
+                self._read_bucket, self._get_table.query,
                 Select="ALL_ATTRIBUTES",
-                KeyConditionExpression=Key("pk").eq(pk) & Key("sk").between(sk1, sk2),
+                KeyConditionExpression=Key("pk").eq(f"#account:{self._account_id}#suffix:{suffix}") & Key("sk").between(sk1, sk2),
                 ScanIndexForward=True,
                 Limit=1
             )
-            res.extend(res_api["Items"])
+            return res_api["Items"]
 
-        res = list(sorted(res, key=lambda val: val["timestamp"], reverse=False))
+        shard_count = self.get_shard_config().read_shard_count
+        res = [item for items in self.get_executor().map(query_shard, range(shard_count)) for item in items]
         if len(res) == 0:
             return None
 
-        res = res[0]
+        res = min(res, key=lambda val: val["sk"])
         res = LogEventEnterPlayer(
             LogEventType.ENTER_PLAYER,
             datetime.fromisoformat(res["timestamp"]),
@@ -297,10 +529,203 @@ class Service:
         )
         return res
 
+    def _put_encounters(self, activities: list[LogEvent]) -> float:
+        # ユーザ毎に最初と最後の遭遇を記録 (有効期限は設けない)
+        # 一括書込みでは更新式を使えないため、ユーザ毎に集約した上で並行して更新
+        encounters = dict()
+        for activity in activities:
+            if not isinstance(activity, LogEventEnterPlayer):
+                continue
+            first, last = encounters.get(activity.user_display_name, (activity, activity))
+            # 同時刻のアクティビティは後のものを優先 (アクティビティの上書きと合わせる)
+            first = activity if activity.timestamp <= first.timestamp else first
+            last = activity if activity.timestamp >= last.timestamp else last
+            encounters[activity.user_display_name] = (first, last)
+        return sum(self.get_executor().map(lambda val: self._put_encounter(*val), encounters.values()))
+
+    def _put_encounter(self, first: LogEventEnterPlayer, last: LogEventEnterPlayer) -> float:
+        # 前後して転送されても最初・最後の遭遇が逆転しないよう、記録より新しい (古い) 場合のみ更新
+        # 1. 最後の遭遇を更新 (記録が無ければ最初の遭遇も登録)
+        # 2. 1 の条件を満たさない場合か、記録より古い遭遇の場合は最初の遭遇を更新
+        # (記録済みと分かっている期間はプロセス内に保持し、その期間内の遭遇は更新しない)
+        key = {
+            "pk": f"#account:{self._account_id}#encounter:{self.escape_username(first.user_display_name)}",
+            "sk": "#encounter"
+        }
+        values_first = self._create_encounter_values("first", first)
+        values_last = self._create_encounter_values("last", last)
+        with self._encounter_lock:
+            cached = self._encounter_cache.get(first.user_display_name)
+        if cached is not None and cached[0] <= values_first["first_seen"] and values_last["last_seen"] <= cached[1]:
+            return 0.0
+
+        consumed = 0.0
+        if cached is None or cached[1] < values_last["last_seen"]:
+            try:
+                res_api = self._request(
+                    self._write_bucket, self._put_table.update_item,
+                    Key=key,
+                    UpdateExpression="SET user_display_name = :user_display_name, "
+                    + ", ".join(f"{name} = :{name}" for name in values_last)
+                    + ", " + ", ".join(f"{name} = if_not_exists({name}, :{name})" for name in values_first),
+                    ConditionExpression="attribute_not_exists(last_seen) OR last_seen <= :last_seen",
+                    ExpressionAttributeValues={
+                        ":user_display_name": last.user_display_name,
+                        **{f":{name}": val for name, val in values_last.items()},
+                        **{f":{name}": val for name, val in values_first.items()}
+                    },
+                    ReturnValues="ALL_OLD"
+                )
+                consumed += self.get_consumed_capacity(res_api)
+                old_first_seen = res_api.get("Attributes", dict()).get("first_seen")
+                if old_first_seen is None or old_first_seen <= values_first["first_seen"]:
+                    self._cache_encounter(first.user_display_name, old_first_seen or values_first["first_seen"], values_last["last_seen"])
+                    return consumed
+            except ClientError as ex:
+                if ex.response.get("Error", dict()).get("Code") != "ConditionalCheckFailedException":
+                    raise
+
+        try:
+            res_api = self._request(
+                self._write_bucket, self._put_table.update_item,
+                Key=key,
+                UpdateExpression="SET " + ", ".join(f"{name} = :{name}" for name in values_first),
+                ConditionExpression="first_seen > :first_seen",
+                ExpressionAttributeValues={f":{name}": val for name, val in values_first.items()}
+            )
+            consumed += self.get_consumed_capacity(res_api)
+        except ClientError as ex:
+            if ex.response.get("Error", dict()).get("Code") != "ConditionalCheckFailedException":
+                raise
+        self._cache_encounter(first.user_display_name, values_first["first_seen"], values_last["last_seen"])
+        return consumed
+
+    def _cache_encounter(self, user_display_name: str, first_seen: str, last_seen: str) -> None:
+        # 記録は広がる方向にのみ更新されるため、記録済みと分かった期間を広げて保持
+        with self._encounter_lock:
+            cached = self._encounter_cache.get(user_display_name)
+            if cached is not None:
+                first_seen, last_seen = min(cached[0], first_seen), max(cached[1], last_seen)
+            elif len(self._encounter_cache) >= self.ENCOUNTER_CACHE_LEN:
+                self._encounter_cache.clear()
+            self._encounter_cache[user_display_name] = (first_seen, last_seen)
+
+    def _create_encounter_values(self, prefix: str, activity: LogEventEnterPlayer) -> dict[str, str]:
+        # 時刻は文字列のまま大小を比較できるよう UTC で記録
+        return {
+            f"{prefix}_seen": activity.timestamp.astimezone().astimezone(self.TZ_UTC).isoformat(),
+            f"{prefix}_instance_id": activity.instance_id,
+            f"{prefix}_world_id": activity.world_id,
+            f"{prefix}_world_name": activity.world_name
+        }
+
+    @staticmethod
+    def _encounter_to_activity(item: dict, prefix: str) -> LogEventEnterPlayer:
+        return LogEventEnterPlayer(
+            LogEventType.ENTER_PLAYER,
+            datetime.fromisoformat(item[f"{prefix}_seen"]),
+            item[f"{prefix}_instance_id"],
+            item[f"{prefix}_world_id"],
+            item[f"{prefix}_world_name"],
+            item["user_display_name"]
+        )
+
+    @staticmethod
+    def escape_username(user_display_name: str) -> str:
+        # キーの区切り文字をエスケープ
+        username_esc = user_display_name
+        username_esc = username_esc.replace("\\", "\\\\")
+        username_esc = username_esc.replace("#", "\\u0023")
+        username_esc = username_esc.replace(":", "\\u003a")
+        return username_esc
+
+    def get_shard_config(self, is_refresh: bool = False) -> ShardConfig:
+        # 分割数はアカウント毎のメタデータから取得 (無ければ従来の配置)
+        # (他のプロセスによる変更を反映するため、一定時間でキャッシュを破棄)
+        now = time.monotonic()
+        if self._shard_config is not None and now < self._shard_config_expire and not is_refresh:
+            return self._shard_config
+
+        res_api = self._request(self._read_bucket, self._get_table.get_item, Key={
+            "pk": f"#account:{self._account_id}",
+            "sk": "#config:activity_shard"
+        })
+        item = res_api.get("Item")
+        if item is None:
+            config = ShardConfig(self.SUFFIX_LEN, "sum", self.SUFFIX_LEN)
+        else:
+            config = ShardConfig(int(item["shard_count"]), item["shard_hash"], int(item["read_shard_count"]))
+        self._shard_config = config
+        self._shard_config_expire = now + self.SHARD_CONFIG_TTL_SEC
+        return config
+
+    def put_shard_config(self, config: ShardConfig) -> None:
+        self._request(
+            self._write_bucket, self._put_table.put_item,
+            Item={
+                "pk": f"#account:{self._account_id}",
+                "sk": "#config:activity_shard",
+                "shard_count": config.shard_count,
+                "shard_hash": config.shard_hash,
+                "read_shard_count": config.read_shard_count
+            }
+        )
+        self._shard_config = config
+        self._shard_config_expire = time.monotonic() + self.SHARD_CONFIG_TTL_SEC
+
+    def set_activity_shards(self, shard_count: int, wait_sec: float = None) -> int:
+        # 分割数を変更し、既存のアクティビティを新しい配置へ移す
+        # 1. 新しい配置で書込ませ、読み手には旧配置を含む範囲を問い合わせさせる
+        # 2. 実行中の書き手がキャッシュした設定を破棄するまで待ってから、旧配置の項目を移す
+        # 3. 移し終えたら問い合わせる範囲を新しい分割数まで縮める
+        config_old = self.get_shard_config(True)
+        config = ShardConfig(shard_count, self.SHARD_HASH, max(config_old.read_shard_count, shard_count))
+        self.put_shard_config(config)
+        time.sleep(self.SHARD_CONFIG_TTL_SEC if wait_sec is None else wait_sec)
+
+        count = 0
+        result = BatchWriteResult(0, 0.0, 0)
+        for suffix in range(config.read_shard_count):
+            params = {
+                "KeyConditionExpression": Key("pk").eq(f"#account:{self._account_id}#suffix:{suffix}") & Key("sk").begins_with("#activity:")
+            }
+            while True:
+                res_api = self._request(self._read_bucket, self._get_table.query, **params)
+                items = [item for item in res_api["Items"] if config.get_shard(item["sk"]) != suffix]
+
+                # 新しい配置へ書込んでから旧配置の項目を削除 (移行中は両方が存在してもよい)
+                for i in range(0, len(items), self.BATCH_WRITE_LEN):
+                    chunk = items[i:i + self.BATCH_WRITE_LEN]
+                    self._batch_write([
+                        {"PutRequest": {"Item": {**item, "pk": f"#account:{self._account_id}#suffix:{config.get_shard(item['sk'])}"}}}
+                        for item in chunk
+                    ], result)
+                    self._batch_write([{"DeleteRequest": {"Key": {"pk": item["pk"], "sk": item["sk"]}}} for item in chunk], result)
+                count += len(items)
+
+                if "LastEvaluatedKey" not in res_api:
+                    break
+                params["ExclusiveStartKey"] = res_api["LastEvaluatedKey"]
+
+        config.read_shard_count = shard_count
+        self.put_shard_config(config)
+        self._logger.info(f"アクティビティの分割数を変更 ({config_old.shard_count} -> {shard_count}, {count} 件を移動)")
+        return count
+
+    @staticmethod
+    def get_executor() -> ThreadPoolExecutor:
+        # シャードへの問い合わせに使うスレッドプール (インスタンス間で共有し、初回の使用時に作成)
+        with Service._executor_lock:
+            if Service._executor is None:
+                Service._executor = ThreadPoolExecutor(max_workers=Service.QUERY_WORKERS, thread_name_prefix="dynamodb")
+            return Service._executor
+
     @staticmethod
     def get_accounts(get_table_name: str, current_date: datetime, cooldown_sec: int, limit: int) -> str:
-        dynamodb_res = boto3.resource("dynamodb")
+        dynamodb_res = boto3.resource("dynamodb", config=Service.CLIENT_CONFIG)
         get_table = dynamodb_res.Table(get_table_name)
+        bucket = TokenBucket(Service.READ_CAPACITY_MAX)
+        logger = logging.getLogger(__name__)
 
         unixtime_higher = int(current_date.timestamp())
         unixtime_higher = unixtime_higher - cooldown_sec
@@ -313,7 +738,7 @@ class Service:
             params["Limit"] = limit
         count = 0
         while limit == 0 or count < limit:
-            res_api = get_table.query(**params)
+            res_api = Service.request_with_retry(bucket, logger, get_table.query, **params)
             for item in res_api["Items"]:
                 yield item["vrchat_user_id"]
                 count += 1
@@ -1,6 +1,6 @@
 import enum
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from datetime import datetime
 from enum import Enum, auto
 
@@ -57,48 +57,56 @@ class OperationInfo:
     info_old: UserInfo
 
 
-@dataclass
+# イベントは大量に保持されるため、__slots__ で属性辞書を持たない不変の値とする
+# (dataclass の slots 引数は Python 3.10 以降のため手動で定義)
+@dataclass(frozen=True)
 class LogEvent:
+    __slots__ = ("type", "timestamp")
     type: LogEventType
     timestamp: datetime
 
+    def __reduce__(self):
+        # 不変のため、pickle では属性の代入ではなくコンストラクタで復元
+        return (self.__class__, tuple(getattr(self, f.name) for f in fields(self)))
 
-@dataclass
+
+@dataclass(frozen=True)
 class LogEventEnterWorld(LogEvent):
+    __slots__ = ("instance_id", "world_id", "world_name")
     instance_id: str
     world_id: str
     world_name: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class LogEventLeftWorld(LogEvent):
-    type = LogEventType.LEFT_WORLD
+    __slots__ = ("instance_id", "world_id", "world_name")
     instance_id: str
     world_id: str
     world_name: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class LogEventEnterPlayer(LogEvent):
-    type = LogEventType.ENTER_PLAYER
+    __slots__ = ("instance_id", "world_id", "world_name", "user_display_name")
     instance_id: str
     world_id: str
     world_name: str
     user_display_name: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class LogEventLeftPlayer(LogEvent):
-    type = LogEventType.LEFT_PLAYER
+    __slots__ = ("instance_id", "world_id", "world_name", "user_display_name")
     instance_id: str
     world_id: str
     world_name: str
     user_display_name: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class LogEventInitializedApi(LogEvent):
-    type = LogEventType.INITIALIZE_API
+    __slots__ = ("instance_id", "world_id", "world_name", "user_display_name", "mode")
     instance_id: str
     world_id: str
     world_name: str
@@ -114,6 +122,7 @@ class LogParserStatus:
     current_world_id: str
     current_world_name: str
     current_instance_id: str
+    fingerprint: str = None
 
     def update(self, new_value) -> None:
         self.pos = new_value.pos
@@ -122,6 +131,7 @@ class LogParserStatus:
         self.current_world_id = new_value.current_world_id
         self.current_world_name = new_value.current_world_name
         self.current_instance_id = new_value.current_instance_id
+        self.fingerprint = new_value.fingerprint
 
 
 class VRChatLogError(Exception):
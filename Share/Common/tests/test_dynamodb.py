@@ -88,7 +88,7 @@ class TestService:
         store.put_friend(op)
 
         # フレンド情報を取得
-        res = store.get_friends()
+        res = list(store.get_friends())
         assert len(res) == 3
 
         assert res[0].user_id == friend_info_1a.user_id
@@ -111,7 +111,7 @@ class TestService:
         op = src.dynamodb.OperationInfo(src.dynamodb.ActionType.UPDATE, friend_info_1b, friend_info_1a)
         store.put_friend(op)
 
-        res = store.get_friends()
+        res = list(store.get_friends())
         assert len(res) == 3
 
         assert res[0].user_id == friend_info_1b.user_id
@@ -129,6 +129,9 @@ class TestService:
         assert res[2].regist_date == friend_info_3a.regist_date
         assert res[2].update_date == friend_info_3a.update_date
 
+        # 1ページの件数を超えても全件を取得する
+        assert list(store.get_friends(page_size=1)) == res
+
         # フレンド情報を削除
         op = src.dynamodb.OperationInfo(src.dynamodb.ActionType.REMOVE, None, friend_info_1a)
         store.put_friend(op)
@@ -199,3 +202,275 @@ class TestService:
         assert activity.world_name == "ワールド名_2"
         assert activity.user_display_name == "ユーザ表示名"
         assert activity.timestamp == log_time_4.astimezone()
+
+    def test_crud_activity_batch(self):
+        sys.path.append("src")
+        import src.dynamodb
+
+        logger = logging.getLogger(__name__)
+        store = src.dynamodb.Service(
+            "usr_xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx",
+            os.getenv("APP_GET_TABLE_NAME"),
+            os.getenv("APP_PUT_TABLE_NAME"),
+            boto3.Session(),
+            logger
+        )
+
+        # 1回の書込み上限 (25件) を超えるアクティビティを一括で登録
+        # 同一キーのアクティビティは後のもので上書きされる
+        log_type = src.dynamodb.LogEventType.ENTER_PLAYER
+        log_items = [
+            src.dynamodb.LogEventEnterPlayer(
+                log_type, datetime.datetime(2012, 1, 22, 20, 0, 0) + datetime.timedelta(minutes=i),
+                f"inst_id_{i}", f"wrld_id_{i}", f"ワールド名_{i}", "一括ユーザ表示名")
+            for i in range(60)
+        ]
+        log_items.append(src.dynamodb.LogEventEnterPlayer(
+            log_type, log_items[0].timestamp, "inst_id_x", "wrld_id_x", "ワールド名_x", "一括ユーザ表示名"))
+        store.put_activities(log_items)
+
+        # アクティビティを検索
+        friend_info = src.dynamodb.UserInfo("ユーザ名", "一括ユーザ表示名", 0, 0)
+        max_datetime = datetime.datetime(2012, 1, 23, 1, 0, 0)
+        activity = store.find_first_activity(friend_info, max_datetime)
+        assert activity.instance_id == "inst_id_x"
+        assert activity.timestamp == log_items[0].timestamp.astimezone()
+
+    def test_find_encounter(self):
+        sys.path.append("src")
+        import src.dynamodb
+
+        logger = logging.getLogger(__name__)
+        store = src.dynamodb.Service(
+            "usr_xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx",
+            os.getenv("APP_GET_TABLE_NAME"),
+            os.getenv("APP_PUT_TABLE_NAME"),
+            boto3.Session(),
+            logger
+        )
+
+        # 遭遇の記録は前後して転送されても最初・最後の遭遇を保持する
+        log_type = src.dynamodb.LogEventType.ENTER_PLAYER
+        log_items = [
+            src.dynamodb.LogEventEnterPlayer(
+                log_type, datetime.datetime(2012, 1, 10, 20, 0, 0) + datetime.timedelta(days=i),
+                f"inst_id_{i}", f"wrld_id_{i}", f"ワールド名_{i}", "遭遇#ユーザ:表示名")
+            for i in range(3)
+        ]
+        store.put_activities(log_items[1:2], None)
+        store.put_activities(log_items[2:], None)
+        store.put_activity(log_items[0])
+
+        friend_info = src.dynamodb.UserInfo("ユーザ名", "遭遇#ユーザ:表示名", 0, 0)
+        activity = store.find_first_activity(friend_info, datetime.datetime(2012, 1, 10, 21, 0, 0))
+        assert activity.instance_id == "inst_id_0"
+        assert activity.timestamp == log_items[0].timestamp.astimezone()
+
+        # 期間内に遭遇が無ければ直近の遭遇 (アクティビティの保持期間に依らない)
+        activity = store.find_first_activity(friend_info, datetime.datetime(2012, 2, 1, 0, 0, 0))
+        assert activity.instance_id == "inst_id_2"
+
+        # 最初の遭遇より前
+        assert store.find_first_activity(friend_info, datetime.datetime(2012, 1, 10, 19, 0, 0)) is None
+
+    def test_set_activity_shards(self):
+        sys.path.append("src")
+        import src.dynamodb
+
+        logger = logging.getLogger(__name__)
+        store = src.dynamodb.Service(
+            "usr_xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx",
+            os.getenv("APP_GET_TABLE_NAME"),
+            os.getenv("APP_PUT_TABLE_NAME"),
+            boto3.Session(),
+            logger
+        )
+        log_type = src.dynamodb.LogEventType.ENTER_PLAYER
+        log_items = [
+            src.dynamodb.LogEventEnterPlayer(
+                log_type, datetime.datetime(2012, 1, 22, 20, 0, 0) + datetime.timedelta(minutes=i),
+                f"inst_id_{i}", f"wrld_id_{i}", f"ワールド名_{i}", f"分割ユーザ表示名_{i % 4}")
+            for i in range(40)
+        ]
+        store.put_activities(log_items)
+
+        # 分割数を変更しても同じアクティビティが検索される
+        # (遭遇の記録から求まらないよう、アクティビティを直接検索する)
+        max_datetime = datetime.datetime(2012, 1, 23, 1, 0, 0)
+        for shard_count in (8, 3):
+            store.set_activity_shards(shard_count, 0)
+            assert store.get_shard_config(True).read_shard_count == shard_count
+            for i in range(4):
+                friend_info = src.dynamodb.UserInfo("ユーザ名", f"分割ユーザ表示名_{i}", 0, 0)
+                activity = store._query_first_activity(friend_info, max_datetime, datetime.timedelta(hours=6))
+                assert activity.instance_id == f"inst_id_{i}"
+
+
+class TestShardConfig:
+    def test_get_shard(self):
+        sys.path.append("src")
+        import src.dynamodb
+
+        # 従来の配置はバイト値の総和
+        val_sk = "#activity:user.enter.ユーザ名#timestamp:20120123_012345"
+        legacy = src.dynamodb.ShardConfig(3, "sum", 3)
+        assert legacy.get_shard(val_sk) == sum(val_sk.encode()) % 3
+
+        # 時刻のみ異なるキーも各シャードへ偏りなく分散する
+        target = src.dynamodb.ShardConfig(16, src.dynamodb.Service.SHARD_HASH, 16)
+        counts = [0] * 16
+        for i in range(16_000):
+            counts[target.get_shard(f"#activity:world.enter#timestamp:20120123_{i:06}")] += 1
+        assert min(counts) > 800 and max(counts) < 1200
+        assert target.get_shard(val_sk) == src.dynamodb.ShardConfig(16, "blake2b", 16).get_shard(val_sk)
+
+
+class TestTokenBucket:
+    def test_throttle(self):
+        sys.path.append("src")
+        import src.dynamodb
+
+        # 見積りで前借りし、実績との差を精算する
+        target = src.dynamodb.TokenBucket(100.0)
+        target.acquire(10.0)
+        target.settle(10.0, 2.0)
+        assert target.rate == 100.0
+
+        # スロットリングを受けると流量を下げ (下限あり)、成功が続くと戻す
+        target.throttle()
+        assert target.rate == 50.0
+        for _ in range(10):
+            target.throttle()
+        assert target.rate == src.dynamodb.TokenBucket.RATE_MIN
+        target.settle(0.0, 20.0)
+        assert target.rate == src.dynamodb.TokenBucket.RATE_MIN + 2.0
+
+    def test_request_with_retry(self, monkeypatch):
+        sys.path.append("src")
+        import src.dynamodb
+        from botocore.exceptions import ClientError
+        monkeypatch.setattr(src.dynamodb.Service, "RETRY_BACKOFF_SEC", 0.0)
+
+        # 一時的なエラーは再試行し、消費キャパシティの実績で精算する
+        calls = list()
+        def request(**params):
+            calls.append(params)
+            if len(calls) < 3:
+                raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "PutItem")
+            return {"ConsumedCapacity": {"CapacityUnits": 1.0}}
+
+        bucket = src.dynamodb.TokenBucket(1000.0)
+        logger = logging.getLogger(__name__)
+        res = src.dynamodb.Service.request_with_retry(bucket, logger, request, Item={"pk": "pk"})
+        assert len(calls) == 3 and calls[-1] == {"Item": {"pk": "pk"}, "ReturnConsumedCapacity": "TOTAL"}
+        assert src.dynamodb.Service.get_consumed_capacity(res) == 1.0
+        assert bucket.rate < 1000.0
+
+        # 接続・通信のエラーも再試行する
+        from botocore.exceptions import EndpointConnectionError, ReadTimeoutError
+        def request_conn(**params):
+            calls.append(params)
+            if len(calls) == 1:
+                raise EndpointConnectionError(endpoint_url="https://dynamodb.invalid")
+            if len(calls) == 2:
+                raise ReadTimeoutError(endpoint_url="https://dynamodb.invalid")
+            return {"ConsumedCapacity": {"CapacityUnits": 1.0}}
+
+        calls.clear()
+        res = src.dynamodb.Service.request_with_retry(bucket, logger, request_conn)
+        assert len(calls) == 3
+        assert src.dynamodb.Service.get_consumed_capacity(res) == 1.0
+
+        # それ以外のエラーは再試行しない
+        def request_invalid(**params):
+            calls.append(params)
+            raise ClientError({"Error": {"Code": "ValidationException"}}, "PutItem")
+
+        calls.clear()
+        try:
+            src.dynamodb.Service.request_with_retry(bucket, logger, request_invalid)
+            assert False
+        except ClientError:
+            pass
+        assert len(calls) == 1
+
+
+class TestEncounter:
+    class FakeTable:
+        # 遭遇の記録の条件付き更新のみを模した書込み先
+        def __init__(self):
+            self.name = "fake"
+            self.items = dict()
+            self.calls = list()
+
+        def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues, ReturnValues=None, **params):
+            from botocore.exceptions import ClientError
+            self.calls.append(ConditionExpression)
+            key = (Key["pk"], Key["sk"])
+            old = self.items.get(key)
+            values = {name[1:]: val for name, val in ExpressionAttributeValues.items()}
+            if ConditionExpression.startswith("attribute_not_exists(last_seen)"):
+                if old is not None and not old["last_seen"] <= values["last_seen"]:
+                    raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+                new = dict(old or dict())
+                new.update({name: val for name, val in values.items() if not name.startswith("first_")})
+                new.update({name: val for name, val in values.items() if name.startswith("first_") and name not in new})
+            else:
+                if old is None or not old["first_seen"] > values["first_seen"]:
+                    raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+                new = {**old, **values}
+            self.items[key] = new
+            return {"Attributes": old} if ReturnValues == "ALL_OLD" and old is not None else dict()
+
+    class FakeSession:
+        def __init__(self, table):
+            self._table = table
+
+        def client(self, name, config=None):
+            return None
+
+        def resource(self, name, config=None):
+            session = self
+            class Resource:
+                def Table(self, table_name):
+                    return session._table
+            return Resource()
+
+    def test_put_encounters(self):
+        sys.path.append("src")
+        import src.dynamodb
+
+        table = self.FakeTable()
+        store = src.dynamodb.Service("usr_xxx", "fake", "fake", self.FakeSession(table), logging.getLogger(__name__))
+        def create_activities(hours):
+            return [
+                src.dynamodb.LogEventEnterPlayer(
+                    src.dynamodb.LogEventType.ENTER_PLAYER, datetime.datetime(2012, 1, 23, hour, 0, 0),
+                    f"inst_id_{hour}", f"wrld_id_{hour}", f"ワールド名_{hour}", "ユーザ表示名")
+                for hour in hours
+            ]
+
+        # 新しい遭遇のみ1回の更新で記録される
+        store._put_encounters(create_activities([3, 4, 5]))
+        assert len(table.calls) == 1
+        item = next(iter(table.items.values()))
+        assert item["first_instance_id"] == "inst_id_3" and item["last_instance_id"] == "inst_id_5"
+
+        # 記録済みの期間内の遭遇は更新しない
+        table.calls.clear()
+        store._put_encounters(create_activities([3, 4, 5]))
+        store._put_encounters(create_activities([4]))
+        assert len(table.calls) == 0
+
+        # 記録より古い遭遇は最初の遭遇のみ更新
+        table.calls.clear()
+        store._put_encounters(create_activities([1, 2]))
+        assert len(table.calls) == 1
+        item = next(iter(table.items.values()))
+        assert item["first_instance_id"] == "inst_id_1" and item["last_instance_id"] == "inst_id_5"
+
+        # 他のプロセスで更新された記録も逆転しない
+        store2 = src.dynamodb.Service("usr_xxx", "fake", "fake", self.FakeSession(table), logging.getLogger(__name__))
+        store2._put_encounters(create_activities([2, 3]))
+        item = next(iter(table.items.values()))
+        assert item["first_instance_id"] == "inst_id_1" and item["last_instance_id"] == "inst_id_5"